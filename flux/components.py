@@ -6,6 +6,11 @@ from spire.runtime import onstartup
 import flux.models
 from flux.bindings import docket, platoon
 from flux.bundles import API
+from flux.engine.dispatcher import ProcessDispatcher
+from flux.engine.executor import LocalExecutor, register_local_operation
+from flux.engine.inbox import CallbackInbox
+from flux.engine.shard import ShardManager
+from flux.engine.watchdog import ExecutionWatchdog
 from flux.operations import OPERATIONS
 from flux.resources import *
 
@@ -69,6 +74,12 @@ class Flux(Component):
     platoon = MeshDependency('platoon')
     truss = MeshDependency('truss')
 
+    dispatcher = Dependency(ProcessDispatcher)
+    executor = Dependency(LocalExecutor)
+    inbox = Dependency(CallbackInbox)
+    shards = Dependency(ShardManager)
+    watchdog = Dependency(ExecutionWatchdog)
+
     @onstartup(service='flux')
     def startup_flux(self):
         GENERATED_BY.put()
@@ -80,8 +91,16 @@ class Flux(Component):
 
         endpoints = {}
         for operation in OPERATIONS.itervalues():
-            subject, endpoint = operation().register()
+            implementation = operation()
+            subject, endpoint = implementation.register()
             endpoints[subject] = endpoint
+            if implementation.inprocess:
+                register_local_operation(subject, implementation.initiate)
+        self.dispatcher.activate()
+        self.executor.activate()
+        self.inbox.activate()
+        self.shards.activate()
+        self.watchdog.activate()
 
         Executor(id='flux', endpoints=endpoints).put()
 
@@ -1,6 +1,7 @@
 OPERATION_PHASES = 'operation preoperation postoperation prerun postrun'
 
 ACTIVE_RUN_STATUSES = 'aborting active pending suspended waiting'
+RESUMABLE_RUN_STATUSES = 'aborted failed timedout'
 RUN_STATUSES = 'aborted aborting active completed failed invalidated pending prepared suspended timedout waiting'
 
 REQUEST_STATUSES = 'canceled claimed completed declined done reopened pending prepared failed'
@@ -1,11 +1,12 @@
 from mesh.exceptions import GoneError
 from mesh.standard import bind
 from spire.mesh import ModelController, MeshDependency
-from spire.schema import SchemaDependency
+from spire.schema import NoResultFound, SchemaDependency
 
 from flux.bindings import platoon
 from flux.models import WorkflowExecution as WorkflowExecutionModel
 from flux.resources import Execution
+from flux.engine.action import WaitFor
 
 ScheduledTask = bind(platoon, 'platoon/1.0/scheduledtask')
 
@@ -44,3 +45,13 @@ class ExecutionController(ModelController):
         if task == 'abort-run':
             subject.run.abort_executions(session)
             session.commit()
+        elif task == 'retry-execution':
+            subject.retry(session)
+            session.commit()
+        elif task == 'wake-executions':
+            event = data.get('event')
+            if event:
+                WaitFor.dispatch_event(session, event)
+            else:
+                WaitFor.sweep(session)
+            session.commit()
@@ -2,8 +2,9 @@ from spire.core import Dependency
 from spire.mesh import MeshDependency, ModelController
 from spire.schema import NoResultFound, OperationError, SchemaDependency
 
-from flux.engine.queue import QueueManager
 from flux.models import *
+from flux.engine.inbox import CallbackInbox
+from flux.engine.queue import QueueManager
 from flux.operations import *
 from flux.resources import Operation as OperationResource
 
@@ -28,6 +29,9 @@ class OperationController(ModelController):
         session.commit()
         response({'id': subject.id})
 
+    def delete(self, request, response, subject, data):
+        super(OperationController, self).delete(request, response, subject, data)
+
     def operation(self, request, response, subject, data):
         operation = OPERATIONS.get(data['subject'])
         if operation:
@@ -37,19 +41,39 @@ class OperationController(ModelController):
 
     def process(self, request, response, subject, data):
         session = self.schema.session
+        status = data['status']
+        if status in ('aborted', 'completed', 'failed', 'timedout'):
+            output, delivery = data.get('output'), data.get('delivery')
+            if not CallbackInbox.receive(session, data['id'], status, output, delivery):
+                WorkflowExecution.process_outcome(session, data['id'], status, output,
+                    delivery)
+            return
+
         try:
             execution = WorkflowExecution.load(session, id=data['id'], lockmode='update')
         except NoResultFound:
             return # todo: address exception properly
 
-        status = data['status']
-        if status in ('aborted', 'completed', 'failed', 'timedout'):
-            execution.process(session, status, data.get('output'))
-        elif status == 'executing':
+        if status == 'executing':
             execution.update_progress(session, data.get('progress'))
 
         session.commit()
 
+    def process_batch(self, request, response, subject, data):
+        session = self.schema.session
+        processes = data['processes']
+
+        results = CallbackInbox.receive_batch(session, processes)
+        remaining = [i for i, result in enumerate(results) if result is None]
+        if remaining:
+            processed = WorkflowExecution.process_batch(session,
+                [processes[i] for i in remaining])
+            for i, result in zip(remaining, processed):
+                results[i] = result
+
+        response({'results': [{'id': process['id'], 'result': result}
+            for process, result in zip(processes, results)]})
+
     def task(self, request, response, subject, data):
         task = data['task']
         if task == 'complete-test-operation':
@@ -1,9 +1,14 @@
+from time import sleep, time
+
+from mesh.exceptions import OperationError
 from mesh.standard import bind
-from scheme import current_timestamp
+from scheme import Integer, current_timestamp
+from spire.core import Configuration
 from spire.mesh import MeshDependency, ModelController, support_returning
 from spire.schema import NoResultFound, SchemaDependency
 
 from flux.bindings import platoon, truss
+from flux.constants import *
 from flux.engine.queue import QueueManager
 from flux.models import *
 from flux.resources import Run as RunResource
@@ -12,12 +17,21 @@ Message = bind(truss, 'truss/1.0/message')
 ScheduledTask = bind(platoon, 'platoon/1.0/scheduledtask')
 SubscribedTask = bind(platoon, 'platoon/1.0/subscribedtask')
 
+INLINE_WAIT = 30
+
 class RunController(ModelController):
     resource = RunResource
     version = (1, 0)
 
     model = Run
-    mapping = 'id workflow_id name status parameters started ended'
+    mapping = (
+        'id workflow_id name status parameters ephemeral priority '
+        'timeout started ended deadline queued'
+    )
+    configuration = Configuration({
+        'max_backlog': Integer(minimum=1, default=10000),
+    })
+
     schema = SchemaDependency('flux')
 
     flux = MeshDependency('flux')
@@ -26,7 +40,14 @@ class RunController(ModelController):
     @support_returning
     def create(self, request, response, subject, data):
         session = self.schema.session
-        subject = self.model.create(session, **data)
+        execute = data.pop('execute', None)
+        wait = data.pop('wait', None)
+
+        if data.get('status', 'pending') == 'pending':
+            if self.model.backlog_reaches(session, self.configuration['max_backlog']):
+                raise OperationError(token='run-backlog-exceeded')
+
+        subject = self.model.create(session, inline=(execute == 'inline'), **data)
         session.commit()
 
         notify = data.get('notify')
@@ -40,9 +61,13 @@ class RunController(ModelController):
                 topic='run:ended', aspects={'id': subject.id})
 
         if subject.status == 'pending':
-            ScheduledTask.queue_http_task('initiate-run',
-                self.flux.prepare('flux/1.0/run', 'task', None,
-                {'task': 'initiate-run', 'id': subject.id}))
+            if execute == 'inline':
+                subject = self._execute_inline(session, subject, wait or INLINE_WAIT)
+            else:
+                ScheduledTask.queue_http_task('initiate-run',
+                    self.flux.prepare('flux/1.0/run', 'task', None,
+                    {'task': 'initiate-run', 'id': subject.id}),
+                    **self._prioritize(subject))
 
         return subject
 
@@ -61,7 +86,13 @@ class RunController(ModelController):
         elif task == 'initiate':
             session.call_after_commit(ScheduledTask.queue_http_task, 'initiate-run',
                 self.flux.prepare('flux/1.0/run', 'task', None,
-                    {'task': 'initiate-run', 'id': subject.id}))
+                    {'task': 'initiate-run', 'id': subject.id}),
+                **self._prioritize(subject))
+        elif task == 'resume':
+            session.call_after_commit(ScheduledTask.queue_http_task, 'resume-run',
+                self.flux.prepare('flux/1.0/run', 'task', None,
+                    {'task': 'resume-run', 'id': subject.id}),
+                **self._prioritize(subject))
 
         session.commit()
         return subject
@@ -69,18 +100,30 @@ class RunController(ModelController):
     def task(self, request, response, subject, data):
         session = self.schema.session
         if 'id' in data:
+            lockmode = 'update'
+            if data['task'] in ('initiate-run', 'resume-run'):
+                lockmode = None
             try:
-                subject = self.model.load(session, id=data['id'], lockmode='update')
+                subject = self.model.load(session, id=data['id'], lockmode=lockmode)
             except NoResultFound:
                 return
 
         task = data['task']
         if task == 'initiate-run':
-            subject.initiate(session)
+            subject.admit(session)
+            session.commit()
+        elif task == 'admit-runs':
+            self.model.admit_queued(session, data['workflow_id'])
             session.commit()
         elif task == 'abort-executions':
             subject.abort_executions(session)
             session.commit()
+        elif task == 'resume-run':
+            subject.admit(session)
+            session.commit()
+        elif task == 'compact-run':
+            subject.compact(session)
+            session.commit()
         elif task == 'run-completion':
             if subject.status == 'completed':
                 self._send_completion_email(subject, data)
@@ -102,6 +145,26 @@ class RunController(ModelController):
             executions = [e.extract_dict(attrs=attrs) for e in model.executions.all()]
             resource['executions'] = executions
 
+    def _execute_inline(self, session, subject, wait):
+        admitted = subject.admit(session)
+        session.commit()
+        if not admitted:
+            return subject
+
+        id = subject.id
+        deadline, interval = time() + wait, 0.05
+        while subject.is_active and not subject.queued and time() < deadline:
+            session.close()
+            sleep(min(interval, max(deadline - time(), 0)))
+            interval = min(interval * 2, 1.0)
+            subject = self.model.load(session, id=id)
+        return subject
+
+    def _prioritize(self, subject):
+        if subject.priority:
+            return {'priority': subject.priority}
+        return {}
+
     def _send_completion_email(self, subject, data):
         notify = set(data['notify'].split(','))
         recipients = [{'to': list(notify)}]
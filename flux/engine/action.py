@@ -1,7 +1,16 @@
+import json
+from datetime import timedelta
+
+from mesh.exceptions import OperationError
 from scheme import *
+from scheme import current_timestamp
+from spire.support.logs import LogHelper
+
+from flux.engine.interpolation import Interpolator, Template
+from flux.engine.tasks import queue_task, subscribe_task
+from flux.models import Operation, WorkflowExecution
 
-from flux.engine.interpolation import Interpolator
-from flux.models import Operation
+log = LogHelper('flux')
 
 class Action(Element):
     """A workflow action."""
@@ -16,6 +25,13 @@ class Action(Element):
                 'step': Token(nonempty=True),
                 'parameters': Field(),
             },
+            'execute-foreach': {
+                'step': Token(nonempty=True),
+                'sequence': Field(nonempty=True),
+                'parameters': Field(),
+                'max_concurrency': Integer(minimum=1),
+                'join': Token(nonempty=True),
+            },
             'ignore-step-failure': {
             },
             'promote-products': {
@@ -24,10 +40,20 @@ class Action(Element):
             'update-environment': {
                 'parameters': Map(Text(nonempty=True), Token(nonempty=True), nonempty=True),
             },
+            'wait-for': {
+                'step': Token(nonempty=True),
+                'parameters': Field(),
+                'delay': Integer(minimum=1),
+                'topic': Token(nonempty=True),
+                'aspects': Map(Field(nonempty=True), Token(nonempty=True)),
+            },
         },
         nonempty=True,
         polymorphic_on='action')
 
+    def compile(self):
+        pass
+
     def execute(self):
         raise NotImplementedError()
 
@@ -48,6 +74,148 @@ class ExecuteStep(Action):
         step.initiate(session, environment.run, environment.ancestor,
             self.parameters, values)
 
+class ExecuteForEach(Action):
+    polymorphic_identity = 'execute-foreach'
+    interpolation_schema = Field(nonempty=True)
+    template = None
+
+    def compile(self):
+        if isinstance(self.sequence, basestring):
+            self.template = Template(self.interpolation_schema, self.sequence)
+
+    def execute(self, session, environment):
+        if environment.failure:
+            return
+
+        sequence = self.sequence
+        if isinstance(sequence, basestring):
+            sequence = environment.interpolator.interpolate(self.interpolation_schema,
+                self.template or sequence)
+        if not isinstance(sequence, (list, tuple)):
+            raise OperationError(token='invalid-foreach-sequence')
+
+        run = environment.run
+        coordinator = run.create_execution(session, self.step, ancestor=environment.ancestor,
+            name='%s (foreach)' % self.step)
+        session.flush()
+
+        coordinator.state = {'foreach': {
+            'step': self.step,
+            'parameters': self.parameters,
+            'items': list(sequence),
+            'max_concurrency': self.max_concurrency,
+            'join': self.join,
+            'next': 0,
+        }}
+        coordinator.start()
+        self.advance(session, run, coordinator, environment.workflow)
+
+    @classmethod
+    def abandon(cls, session, run, coordinator):
+        """Fails the foreach ``coordinator`` after one of its elements has failed
+        without the failure being ignored, initiating no further elements."""
+
+        if coordinator.is_active:
+            coordinator.ended = current_timestamp()
+            coordinator.fail(session, 'failed')
+
+    @classmethod
+    def advance(cls, session, run, coordinator, workflow, element=None):
+        """Advances the foreach ``coordinator`` once ``element`` has ended, initiating
+        further elements up to the concurrency limit and joining once every element
+        has ended. The number of active elements and the result of each ended element
+        are kept on the state of the coordinator, so that its elements are never
+        rescanned. Once every element has ended, the collected results become the
+        output of the coordinator, whether or not a join step follows."""
+
+        if not coordinator.is_active:
+            return
+
+        state = coordinator.state['foreach']
+        items = state['items']
+        active = state.get('active', 0)
+        results = state.get('results') or [None] * len(items)
+
+        if element is not None:
+            results = list(results)
+            results[element.state['index']] = cls._record_element(element)
+            active = max(active - 1, 0)
+
+        limit = state.get('max_concurrency') or len(items)
+        step = workflow.steps[state['step']]
+        index = state['next']
+        while index < len(items) and active < limit:
+            values = {'item': items[index], 'index': index}
+            initiated = step.initiate(session, run, coordinator, state.get('parameters'),
+                values)
+            if initiated is None:
+                break
+
+            initiated.state = dict(initiated.state or {}, index=index)
+            index += 1
+            active += 1
+
+        coordinator.state = {'foreach': dict(state, next=index, active=active,
+            results=results)}
+        if active or index < len(items):
+            return
+
+        coordinator.ended = current_timestamp()
+        coordinator.output = {'items': [dict(result or {}, item=item)
+            for item, result in zip(items, results)]}
+        coordinator.complete(session, 'completed')
+
+        join = state.get('join')
+        if join:
+            values = cls._collect_results(session, run, items, results)
+            workflow.steps[join].initiate(session, run, coordinator, values=values)
+
+    @classmethod
+    def resume(cls, session, run, coordinator, workflow):
+        """Advances the foreach ``coordinator`` of a resumed run, once the number of
+        its active elements and the results of its ended elements have been counted
+        anew, as resuming a run reactivates elements which had ended."""
+
+        state = coordinator.state['foreach']
+        active, results = 0, [None] * len(state['items'])
+        for element in coordinator.descendants:
+            if element.state and 'index' in element.state and not element.is_superseded:
+                if element.is_active:
+                    active += 1
+                else:
+                    results[element.state['index']] = cls._record_element(element)
+
+        coordinator.state = {'foreach': dict(state, active=active, results=results)}
+        cls.advance(session, run, coordinator, workflow)
+
+    @classmethod
+    def _collect_results(cls, session, run, items, results):
+        plan = run.workflow.acquire_plan(session)
+        out = [None] * len(items)
+        collected = [{'item': item} for item in items]
+
+        for index, result in enumerate(results):
+            if not result:
+                continue
+
+            values = None
+            if result['output'] and result['outcome']:
+                operation = plan.steps[result['step']].operation
+                outcome = operation.outcomes[result['outcome']]
+                values = outcome.schema.unserialize(result['output'])
+
+            collected[index].update(status=result['status'], outcome=result['outcome'],
+                out=values)
+            if result['status'] == 'completed':
+                out[index] = values
+
+        return {'step': {'out': out}, 'items': collected}
+
+    @staticmethod
+    def _record_element(element):
+        return {'step': element.step, 'status': element.status,
+            'outcome': element.outcome, 'output': element.output}
+
 class IgnoreStepFailure(Action):
     polymorphic_identity = 'ignore-step-failure'
 
@@ -57,16 +225,180 @@ class IgnoreStepFailure(Action):
 class PromoteProducts(Action):
     polymorphic_identity = 'promote-products'
     interpolation_schema = Map(Surrogate(nonempty=True), Token(nonempty=True))
+    template = None
+
+    def compile(self):
+        self.template = Template(self.interpolation_schema, self.products)
 
     def execute(self, session, environment):
-        products = environment.interpolator.interpolate(self.interpolation_schema, self.products)
+        products = environment.interpolator.interpolate(self.interpolation_schema,
+            self.template or self.products)
         for token, product in products.iteritems():
             environment.run.associate_product(token, product)
 
 class UpdateEnvironment(Action):
     polymorphic_identity = 'update-environment'
     interpolation_schema = Map(Field(nonempty=True), Token(nonempty=True))
+    template = None
+
+    def compile(self):
+        self.template = Template(self.interpolation_schema, self.parameters)
 
     def execute(self, session, environment):
-        parameters = environment.interpolator.interpolate(self.interpolation_schema, self.parameters)
+        parameters = environment.interpolator.interpolate(self.interpolation_schema,
+            self.template or self.parameters)
         environment.run.update_environment(parameters)
+
+class WaitFor(Action):
+    polymorphic_identity = 'wait-for'
+    interpolation_schema = Map(Field(nonempty=True), Token(nonempty=True))
+    template = None
+
+    def compile(self):
+        if self.aspects:
+            self.template = Template(self.interpolation_schema, self.aspects)
+
+    def execute(self, session, environment):
+        if environment.failure:
+            return
+
+        aspects = None
+        if self.aspects:
+            aspects = environment.interpolator.interpolate(self.interpolation_schema,
+                self.template or self.aspects)
+
+        run = environment.run
+        execution = run.create_execution(session, self.step, ancestor=environment.ancestor,
+            name='%s (wait)' % self.step)
+        session.flush()
+
+        execution.state = {'wait': {
+            'step': self.step,
+            'parameters': self.parameters,
+            'delay': self.delay,
+            'aspects': aspects,
+        }}
+        execution.topic = self.topic
+        execution.aspect_keys, execution.aspect = self._identify_aspects(aspects)
+        execution.start()
+        self.suspend(session, execution)
+
+    @classmethod
+    def suspend(cls, session, execution):
+        """Suspends the waiting ``execution`` until its delay elapses or an event it
+        waits for is fired. Delays are served by a shared sweep of waiting executions
+        and events by one subscription per topic."""
+
+        state = execution.state['wait']
+        execution.wake = None
+        if state.get('delay'):
+            execution.wake = current_timestamp() + timedelta(seconds=state['delay'])
+
+        execution.wait(session)
+        session.flush()
+
+        if execution.topic:
+            session.call_after_commit(subscribe_task, 'execution', 'wake-executions',
+                execution.topic)
+
+        if execution.wake:
+            query = (session.query(WorkflowExecution.id)
+                .filter(WorkflowExecution.status == 'waiting')
+                .filter(WorkflowExecution.wake <= execution.wake)
+                .filter(WorkflowExecution.id != execution.id))
+            if not query.first():
+                session.call_after_commit(queue_task, 'execution', 'wake-executions',
+                    delta=state['delay'])
+
+    @classmethod
+    def dispatch_event(cls, session, event):
+        """Wakes the executions waiting for ``event``. For each set of aspect keys
+        waited on for the topic of ``event``, only the executions whose aspects
+        match the values of those keys in ``event`` are locked and woken."""
+
+        topic = event.get('topic')
+        keysets = (session.query(WorkflowExecution.aspect_keys).distinct()
+            .filter_by(status='waiting', topic=topic).all())
+
+        for (keys,) in keysets:
+            aspect = None
+            if keys:
+                aspects = dict((key, event.get(key)) for key in json.loads(keys))
+                aspect = cls._identify_aspects(aspects)[1]
+
+            query = (session.query(WorkflowExecution).with_lockmode('update')
+                .filter_by(status='waiting', topic=topic, aspect=aspect))
+            for execution in query:
+                cls._wake(session, execution, event)
+
+    @classmethod
+    def sweep(cls, session, limit=100):
+        """Wakes the waiting executions whose delay has elapsed, then queues another
+        sweep for the next one to elapse."""
+
+        now = current_timestamp()
+        query = (session.query(WorkflowExecution).with_lockmode('update')
+            .filter(WorkflowExecution.status == 'waiting')
+            .filter(WorkflowExecution.wake <= now)
+            .order_by(WorkflowExecution.wake).limit(limit))
+
+        executions = query.all()
+        for execution in executions:
+            cls._wake(session, execution)
+
+        if len(executions) == limit:
+            delta = None
+        else:
+            wake = (session.query(WorkflowExecution.wake)
+                .filter(WorkflowExecution.status == 'waiting')
+                .filter(WorkflowExecution.wake != None)
+                .order_by(WorkflowExecution.wake).limit(1).scalar())
+            if not wake:
+                return
+            delta = max(int((wake - current_timestamp()).total_seconds()) + 1, 1)
+        session.call_after_commit(queue_task, 'execution', 'wake-executions', delta=delta)
+
+    @staticmethod
+    def _identify_aspects(aspects):
+        """Returns the sorted keys of ``aspects`` and its keys and values, serialized
+        in a canonical form by which waiting executions are matched with events."""
+
+        if not aspects:
+            return None, None
+
+        keys = sorted(aspects)
+        return (json.dumps(keys),
+            json.dumps([[key, unicode(aspects[key])] for key in keys]))
+
+    @classmethod
+    def _wake(cls, session, execution, event=None):
+        run = execution.run
+        session.flush()
+        session.refresh(run, lockmode='update')
+
+        checkpoint = run.checkpoint()
+        session.begin_nested()
+        try:
+            execution.ended = current_timestamp()
+            if event is None and execution.topic:
+                execution.timeout(session)
+                if run.is_active:
+                    run.timeout(session)
+            else:
+                execution.complete(session, 'completed')
+                state = execution.state['wait']
+
+                values = ({'event': event} if event else None)
+                workflow = run.workflow.workflow
+                workflow.steps[state['step']].initiate(session, run, execution,
+                    state.get('parameters'), values)
+                run.conclude(session)
+        except Exception:
+            session.rollback()
+            log('exception', 'waking of %r failed due to exception', execution)
+            run.restore(checkpoint)
+            run.fail(session)
+        else:
+            session.commit()
+            run.process_deferred(session)
+
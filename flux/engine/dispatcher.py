@@ -0,0 +1,125 @@
+import atexit
+from itertools import count
+from Queue import Empty, PriorityQueue
+from threading import Lock, Thread
+
+from mesh.standard import bind
+from scheme import Integer
+from spire.core import Configuration, Unit
+from spire.schema import SchemaDependency
+from spire.support.logs import LogHelper
+
+from flux.bindings import platoon
+from flux.engine.inbox import CallbackInbox
+
+__all__ = ('ProcessDispatcher', 'create_process')
+
+log = LogHelper('flux')
+
+Process = bind(platoon, 'platoon/1.0/process')
+
+def create_process(queue_id, tag, input=None, id=None, timeout=None, priority=None):
+    params = {'queue_id': queue_id, 'tag': tag}
+    if id is not None:
+        params['id'] = id
+    if input is not None:
+        params['input'] = input
+    if timeout is not None:
+        params['timeout'] = timeout
+    if priority:
+        params['priority'] = priority
+    return Process.create(**params)
+
+class ProcessDispatcher(Unit):
+    """Creates processes on a bounded pool of threads, so that the processes
+    initiated by a transaction are created concurrently rather than one after
+    another once it commits. Pending processes of a higher priority are created
+    first. An execution whose process cannot be created is processed as failed,
+    and processes still pending when this process exits are created before it
+    does."""
+
+    configuration = Configuration({
+        'concurrency': Integer(minimum=0, default=8),
+    })
+
+    schema = SchemaDependency('flux')
+
+    active = None
+    guard = Lock()
+    queue = None
+    sequence = count()
+
+    def activate(self):
+        if self.configuration['concurrency'] and not self.active:
+            ProcessDispatcher.active = self
+            atexit.register(self.flush)
+
+    @classmethod
+    def dispatch(cls, queue_id, tag, input=None, id=None, timeout=None, priority=None):
+        """Dispatches the creation of a process to the active dispatcher, creating it
+        at once if there is none."""
+
+        dispatcher = cls.active
+        if dispatcher:
+            dispatcher.enqueue(queue_id, tag, input, id, timeout, priority)
+        else:
+            create_process(queue_id, tag, input, id, timeout, priority)
+
+    def enqueue(self, queue_id, tag, input=None, id=None, timeout=None, priority=None):
+        queue = self.queue
+        if queue is None:
+            with self.guard:
+                queue = self.queue
+                if queue is None:
+                    queue = PriorityQueue()
+                    for i in range(self.configuration['concurrency']):
+                        worker = Thread(target=self._work, args=(queue,),
+                            name='flux-dispatcher-%d' % i)
+                        worker.daemon = True
+                        worker.start()
+                    self.queue = queue
+
+        queue.put((-(priority or 0), next(self.sequence),
+            (queue_id, tag, input, id, timeout, priority)))
+
+    def flush(self):
+        """Creates the processes still pending, in order of priority."""
+
+        queue = self.queue
+        if queue is None:
+            return
+
+        while True:
+            try:
+                priority, sequence, params = queue.get_nowait()
+            except Empty:
+                return
+            self._create_process(*params)
+
+    def _create_process(self, queue_id, tag, input, id, timeout, priority):
+        from flux.models import WorkflowExecution
+
+        try:
+            create_process(queue_id, tag, input, id, timeout, priority)
+        except Exception:
+            log('exception', 'failed to create process %s for %s on %s', id, tag, queue_id)
+        else:
+            return
+
+        if id is None:
+            return
+
+        session = self.schema.session
+        try:
+            if not CallbackInbox.receive(session, id, 'failed'):
+                WorkflowExecution.process_outcome(session, id, 'failed', None)
+        except Exception:
+            session.rollback()
+            log('exception', 'processing of execution %s without a process failed', id)
+        finally:
+            session.close()
+
+    def _work(self, queue):
+        while True:
+            priority, sequence, params = queue.get()
+            self._create_process(*params)
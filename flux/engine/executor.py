@@ -0,0 +1,88 @@
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+
+from scheme import Integer
+from spire.core import Configuration, Unit
+from spire.schema import SchemaDependency
+from spire.support.logs import LogHelper
+
+from flux.engine.inbox import CallbackInbox
+
+__all__ = ('LocalExecutor', 'register_local_operation')
+
+log = LogHelper('flux')
+
+LOCAL_OPERATIONS = {}
+
+def register_local_operation(id, implementation):
+    """Registers ``implementation`` as the in-process implementation of the operation
+    identified by ``id``. The implementation is called with a session and the data
+    platoon would send to initiate the operation, and must return a completed, failed,
+    aborted or timedout process response, as an operation would."""
+
+    LOCAL_OPERATIONS[id] = implementation
+
+class LocalExecutor(Unit):
+    """Executes in-process operations on a bounded pool of threads, feeding their
+    outcomes straight into the processing of their executions."""
+
+    configuration = Configuration({
+        'concurrency': Integer(minimum=0, default=4),
+    })
+
+    schema = SchemaDependency('flux')
+
+    active = None
+    guard = Lock()
+    pool = None
+
+    def activate(self):
+        if self.configuration['concurrency']:
+            LocalExecutor.active = self
+
+    @classmethod
+    def dispatch(cls, operation_id, tag, input=None, id=None):
+        """Dispatches the initiation of the identified operation to the active local
+        executor, returning ``False`` if it must instead be created as a process."""
+
+        executor = cls.active
+        if not (executor and id and operation_id in LOCAL_OPERATIONS):
+            return False
+
+        pool = executor.pool
+        if pool is None:
+            with executor.guard:
+                pool = executor.pool
+                if pool is None:
+                    pool = ThreadPool(executor.configuration['concurrency'])
+                    executor.pool = pool
+
+        pool.apply_async(executor._execute, (operation_id, tag, input, id))
+        return True
+
+    def _execute(self, operation_id, tag, input, id):
+        from flux.models import WorkflowExecution
+
+        session = self.schema.session
+        try:
+            implementation = LOCAL_OPERATIONS[operation_id]
+            data = {'id': id, 'tag': tag, 'input': input, 'status': 'initiating'}
+            try:
+                response = implementation(session, data) or {}
+            except Exception:
+                log('exception', 'local execution of %s for %s failed', operation_id, id)
+                response = {'status': 'failed'}
+
+            status = response.get('status')
+            if status not in ('aborted', 'completed', 'failed', 'timedout'):
+                log('error', 'local execution of %s for %s did not complete', operation_id, id)
+                status, response = 'failed', {}
+
+            output = response.get('output')
+            if not CallbackInbox.receive(session, id, status, output):
+                WorkflowExecution.process_outcome(session, id, status, output)
+        except Exception:
+            session.rollback()
+            log('exception', 'processing of local execution %s failed', id)
+        finally:
+            session.close()
@@ -0,0 +1,216 @@
+import os
+import socket
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+from thread import get_ident
+from threading import Lock, Thread
+from time import sleep
+
+from scheme import Integer, current_timestamp
+from spire.core import Configuration, Unit
+from spire.schema import SchemaDependency
+from spire.support.logs import LogHelper
+
+from flux.engine.shard import ShardManager
+
+__all__ = ('CallbackInbox',)
+
+log = LogHelper('flux')
+
+class CallbackInbox(Unit):
+    """Persists the outcomes of executions reported by platoon so that they can be
+    acknowledged at once, and processes them on a bounded pool of workers. The
+    entries of a run are processed in the order in which they were received, by
+    the one worker across all processes which holds the claim of the run, a lease
+    which it renews as it drains the run. An entry whose processing fails is kept
+    and retried with exponential backoff, holding back the later entries of its
+    run, until its attempts are exhausted. Entries left behind by workers which
+    have ceased, and entries due for a retry, are recovered periodically. When runs
+    are sharded across nodes, entries are left to the node which owns the shard of
+    their run."""
+
+    configuration = Configuration({
+        'concurrency': Integer(minimum=0, default=4),
+        'recovery': Integer(minimum=1, default=60),
+        'attempts': Integer(minimum=1, default=8),
+        'backoff': Integer(minimum=1, default=5),
+        'claim': Integer(minimum=1, default=300),
+    })
+
+    schema = SchemaDependency('flux')
+
+    active = None
+    guard = Lock()
+    pool = None
+    thread = None
+
+    @property
+    def holder(self):
+        return '%s-%d-%d' % (socket.gethostname(), os.getpid(), get_ident())
+
+    def activate(self):
+        if self.configuration['concurrency'] and not self.thread:
+            CallbackInbox.active = self
+            self.thread = Thread(target=self._maintain, name='flux-inbox')
+            self.thread.daemon = True
+            self.thread.start()
+
+    @classmethod
+    def receive(cls, session, execution_id, status, output=None, delivery=None):
+        """Persists an outcome of the identified execution and queues it for
+        processing, returning ``False`` if it must instead be processed at once."""
+
+        from flux.models import InboxEntry
+
+        inbox = cls.active
+        if not inbox:
+            return False
+
+        entry = InboxEntry.create(session, execution_id, status, output, delivery)
+        if entry:
+            entry.shard = ShardManager.shard_of(entry.run_id)
+        session.commit()
+        if entry and ShardManager.owns(entry.shard):
+            inbox.dispatch(entry.run_id)
+        return True
+
+    @classmethod
+    def receive_batch(cls, session, updates):
+        """Persists the outcomes among a batch of status updates of executions and
+        queues them for processing, returning the result of each update, which is
+        ``None`` for an update which must instead be processed at once."""
+
+        from flux.models import InboxEntry
+
+        results = [None] * len(updates)
+        inbox = cls.active
+        if not inbox:
+            return results
+
+        entries = []
+        for i, update in enumerate(updates):
+            if update['status'] in ('aborted', 'completed', 'failed', 'timedout'):
+                entry = InboxEntry.create(session, update['id'], update['status'],
+                    update.get('output'), update.get('delivery'))
+                if entry:
+                    entry.shard = ShardManager.shard_of(entry.run_id)
+                    entries.append(entry)
+                    results[i] = 'processed'
+                else:
+                    results[i] = 'unknown'
+
+        session.commit()
+        for run_id in set(entry.run_id for entry in entries
+                if ShardManager.owns(entry.shard)):
+            inbox.dispatch(run_id)
+        return results
+
+    def dispatch(self, run_id):
+        pool = self.pool
+        if pool is None:
+            with self.guard:
+                pool = self.pool
+                if pool is None:
+                    pool = ThreadPool(self.configuration['concurrency'])
+                    self.pool = pool
+        pool.apply_async(self._drain, (run_id,))
+
+    def _drain(self, run_id):
+        """Drains the entries of the identified run if no other worker holds the
+        claim of it. Once the run has been drained, its claim is released and the
+        run checked once more for entries received in the meantime, which the
+        worker draining it would otherwise have left to recovery."""
+
+        from flux.models import InboxEntry, Lease
+
+        claim, holder = 'inbox:%s' % run_id, self.holder
+        session = self.schema.session
+        try:
+            while Lease.acquire(session, claim, holder, self.configuration['claim']):
+                entries = [(entry.id, entry.execution_id, entry.status, entry.output,
+                    entry.delivery, entry.attempts, entry.retry)
+                    for entry in InboxEntry.pending(session, run_id)]
+                session.rollback()
+
+                if not entries:
+                    Lease.release(session, claim, holder)
+                    if InboxEntry.pending(session, run_id, 1):
+                        session.rollback()
+                        continue
+                    return
+
+                for entry in entries:
+                    if not self._process(session, *entry):
+                        Lease.release(session, claim, holder)
+                        return
+        except Exception:
+            session.rollback()
+            log('exception', 'draining of inbox entries for run %s failed', run_id)
+            try:
+                Lease.release(session, claim, holder)
+            except Exception:
+                session.rollback()
+        finally:
+            session.close()
+
+    def _maintain(self):
+        while True:
+            self._recover()
+            sleep(self.configuration['recovery'])
+
+    def _process(self, session, id, execution_id, status, output, delivery, attempts,
+            retry):
+        """Processes the identified entry, deleting it once it has been processed or
+        its attempts are exhausted. Returns ``False`` if the entry awaits a retry, in
+        which case the later entries of its run must wait for it."""
+
+        from flux.models import InboxEntry, WorkflowExecution
+
+        now = current_timestamp()
+        if retry and retry > now:
+            return False
+
+        try:
+            WorkflowExecution.process_outcome(session, execution_id, status, output,
+                delivery)
+        except Exception:
+            session.close()
+            attempts += 1
+            log('exception', 'processing of inbox entry %s failed (attempt %d)', id, attempts)
+
+            configuration = self.configuration
+            if attempts < configuration['attempts']:
+                delay = configuration['backoff'] * 2 ** (attempts - 1)
+                session.query(InboxEntry).filter_by(id=id).update({'attempts': attempts,
+                    'retry': now + timedelta(seconds=delay)}, synchronize_session=False)
+                session.commit()
+                return False
+            log('error', 'abandoning inbox entry %s after %d attempts', id, attempts)
+
+        session.query(InboxEntry).filter_by(id=id).delete(synchronize_session=False)
+        session.commit()
+        return True
+
+    def _recover(self):
+        """Dispatches the runs with entries left behind by workers which have ceased,
+        such as those of a previous process, or with entries due for a retry."""
+
+        from flux.models import InboxEntry
+
+        session = self.schema.session
+        try:
+            now = current_timestamp()
+            threshold = now - timedelta(seconds=self.configuration['recovery'])
+            query = (session.query(InboxEntry.run_id, InboxEntry.shard).distinct()
+                .filter(((InboxEntry.retry == None) & (InboxEntry.received < threshold))
+                    | (InboxEntry.retry <= now)))
+            runs = [run_id for run_id, shard in query if ShardManager.owns(shard)]
+        except Exception:
+            log('exception', 'recovery of inbox entries failed')
+            return
+        finally:
+            session.close()
+
+        for run_id in runs:
+            log('info', 'recovering inbox entries for run %s', run_id)
+            self.dispatch(run_id)
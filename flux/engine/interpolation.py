@@ -1,19 +1,259 @@
+import re
+from collections import MutableMapping
+
+from jinja2 import TemplateSyntaxError, UndefinedError
+from scheme import Field, Map, Sequence, Structure
+from scheme.exceptions import UndefinedParameterError
 from scheme.interpolation import Interpolator as BaseInterpolator
-from scheme.util import recursive_merge
 
-base_interpolator = BaseInterpolator()
+VARIABLE_EXPR = re.compile(r'^\s*[$][{]([^}]+)[}]\s*$')
+
+class Layers(MutableMapping):
+    """A mapping which reads through a stack of layers of values without copying
+    them. Nested dicts present in several layers are merged on lookup, with upper
+    layers taking precedence, and writes are made only to the top layer, which
+    is owned by this mapping."""
+
+    def __init__(self, layers):
+        self._layers = layers
+
+    def __contains__(self, key):
+        for layer in self._layers:
+            if layer is not None and key in layer:
+                return True
+        return False
+
+    def __delitem__(self, key):
+        top = self._acquire_top(False)
+        if top is None:
+            raise KeyError(key)
+        del top[key]
+
+    def __getitem__(self, key):
+        top = self._layers[0]
+        candidates = []
+        if top is not None and key in top:
+            value = top[key]
+            if not isinstance(value, dict):
+                return value
+            candidates.append(value)
+
+        for layer in self._layers[1:]:
+            if key in layer:
+                value = layer[key]
+                if isinstance(value, dict):
+                    candidates.append(value)
+                elif candidates:
+                    break
+                else:
+                    return value
+
+        if not candidates:
+            raise KeyError(key)
+        if top is not None and key in top:
+            if len(candidates) == 1:
+                return candidates[0]
+            return NestedLayers(self, key, candidates)
+        return NestedLayers(self, key, [None] + candidates)
+
+    def __iter__(self):
+        seen = set()
+        for layer in self._layers:
+            if layer is not None:
+                for key in layer:
+                    if key not in seen:
+                        seen.add(key)
+                        yield key
+
+    def __len__(self):
+        return len(set(key for layer in self._layers if layer is not None
+            for key in layer))
+
+    def __repr__(self):
+        return repr(self._materialize())
+
+    def __setitem__(self, key, value):
+        self._acquire_top(True)[key] = value
+
+    def _materialize(self):
+        """Returns a plain ``dict`` equivalent to this mapping. The layers are
+        not modified; a single remaining layer is returned as is."""
+
+        layers = [layer for layer in self._layers if layer is not None]
+        if len(layers) == 1:
+            return layers[0]
+        return dict((key, materialize(self[key])) for key in self)
+
+    def _acquire_top(self, create):
+        return self._layers[0]
+
+class NestedLayers(Layers):
+    """A view of a nested value of a layered mapping, whose top layer is created
+    in the top layer of its parent upon the first write."""
+
+    def __init__(self, parent, key, layers):
+        self._key = key
+        self._layers = layers
+        self._parent = parent
+
+    def _acquire_top(self, create):
+        top = self._layers[0]
+        if top is None and create:
+            top = self._layers[0] = {}
+            self._parent._acquire_top(True)[self._key] = top
+        return top
+
+def materialize(value):
+    """Replaces layered mappings within ``value`` with plain values."""
+
+    if isinstance(value, Layers):
+        return value._materialize()
+    elif isinstance(value, dict):
+        result = dict((key, materialize(item)) for key, item in value.iteritems())
+        for key, item in value.iteritems():
+            if result[key] is not item:
+                return result
+    elif isinstance(value, list):
+        result = [materialize(item) for item in value]
+        for i, item in enumerate(value):
+            if result[i] is not item:
+                return result
+    return value
+
+class ValueInterpolator(BaseInterpolator):
+    """The standard interpolator, yielding plain values when evaluating against
+    layered parameters."""
 
-class Interpolator(dict):
-    """A parameter interpolator."""
+    def evaluate(self, subject, parameters):
+        return materialize(super(ValueInterpolator, self).evaluate(subject, parameters))
+
+base_interpolator = ValueInterpolator()
+
+class Interpolator(Layers):
+    """A parameter interpolator, which chains the values merged into it as layers
+    rather than copying them; writes go only to a top layer of its own."""
+
+    def __init__(self, values=None, layers=None):
+        super(Interpolator, self).__init__([{}])
+        if layers:
+            self._layers.extend(layers)
+        if values:
+            self.update(values)
 
     def clone(self):
-        return Interpolator(self)
+        return Interpolator(layers=[layer for layer in self._layers if layer])
 
     def evaluate(self, subject):
+        if isinstance(subject, Expression):
+            return subject.evaluate(self)
         return base_interpolator.evaluate(subject, self)
 
     def interpolate(self, field, subject):
+        if isinstance(subject, Template):
+            return subject.interpolate(self)
         return field.interpolate(subject, self, base_interpolator)
 
     def merge(self, values):
-        recursive_merge(self, values)
+        """Layers ``values`` over the current values of this interpolator, without
+        copying them."""
+
+        if values:
+            top = self._layers[0]
+            self._layers[0:1] = [{}, values] + ([top] if top else [])
+
+class Expression(object):
+    """A compiled interpolation expression."""
+
+    def __init__(self, subject):
+        self.subject = subject
+        try:
+            self.expression = base_interpolator.environment.compile_expression(subject, False)
+        except TemplateSyntaxError:
+            self.expression = None
+
+    def evaluate(self, parameters):
+        expression = self.expression
+        if expression is None:
+            return base_interpolator.evaluate(self.subject, parameters)
+
+        try:
+            value = expression(**parameters)
+        except UndefinedError:
+            raise UndefinedParameterError()
+
+        if isinstance(value, base_interpolator.environment.undefined):
+            raise UndefinedParameterError()
+        return materialize(value)
+
+class Deferred(object):
+    """A template node which is interpolated by its field at evaluation time."""
+
+    def __init__(self, subject):
+        self.subject = subject
+
+class Template(object):
+    """A compiled interpolation template for a value of the specified field."""
+
+    def __init__(self, field, subject):
+        self.field = field
+        self.subject = subject
+        self.template = self._compile(field, subject)
+
+    def interpolate(self, parameters):
+        return self._interpolate(self.field, self.template, parameters)
+
+    def _compile(self, field, subject):
+        if subject is None:
+            return None
+
+        if isinstance(subject, basestring):
+            if type(field) is Field:
+                match = VARIABLE_EXPR.match(subject)
+                if match:
+                    return Expression(match.group(1).strip())
+                else:
+                    return subject
+            elif isinstance(field, (Map, Sequence, Structure)):
+                match = VARIABLE_EXPR.match(subject)
+                if match:
+                    return Expression(match.group(1).strip())
+            return Deferred(subject)
+
+        if isinstance(subject, dict):
+            if isinstance(field, Map):
+                return dict((key, self._compile(field.value, value))
+                    for key, value in subject.iteritems())
+            elif isinstance(field, Structure) and not field.polymorphic:
+                structure = field.structure
+                return dict((name, self._compile(structure[name], value))
+                    for name, value in subject.iteritems() if name in structure)
+        elif isinstance(subject, (list, tuple)) and isinstance(field, Sequence):
+            return [self._compile(field.item, item) for item in subject]
+
+        return Deferred(subject)
+
+    def _interpolate(self, field, template, parameters):
+        if isinstance(template, Expression):
+            value = template.evaluate(parameters)
+            if value is not None and isinstance(field, (Map, Sequence, Structure)):
+                value = field.interpolate(value, parameters, base_interpolator)
+            return value
+        elif isinstance(template, Deferred):
+            return field.interpolate(template.subject, parameters, base_interpolator)
+        elif isinstance(template, dict):
+            interpolation = {}
+            for key, value in template.iteritems():
+                if isinstance(field, Map):
+                    definition = field.value
+                else:
+                    definition = field.structure[key]
+
+                try:
+                    interpolation[key] = self._interpolate(definition, value, parameters)
+                except UndefinedParameterError:
+                    continue
+            return interpolation
+        elif isinstance(template, list):
+            return [self._interpolate(field.item, item, parameters) for item in template]
+        else:
+            return template
@@ -0,0 +1,114 @@
+from copy import deepcopy
+
+from scheme.util import recursive_merge
+from sqlalchemy import func
+
+from flux.engine.dispatcher import ProcessDispatcher
+from flux.engine.executor import LocalExecutor
+from flux.engine.interpolation import Template
+from flux.models.operation import Operation
+
+class OperationPlan(object):
+    """A resolved operation definition."""
+
+    def __init__(self, operation):
+        self.id = operation.id
+        self.name = operation.name
+        self.queue_id = operation.queue_id
+        self.schema = operation.schema
+        self.parameters = operation.parameters
+
+        self.outcomes = {}
+        for name, outcome in operation.outcomes.iteritems():
+            self.outcomes[name] = OutcomePlan(outcome)
+
+    def initiate(self, tag, input=None, id=None, timeout=None, priority=None):
+        if not LocalExecutor.dispatch(self.id, tag, input, id):
+            ProcessDispatcher.dispatch(self.queue_id, tag, input, id, timeout, priority)
+
+class OutcomePlan(object):
+    """A resolved operation outcome."""
+
+    def __init__(self, outcome):
+        self.name = outcome.name
+        self.outcome = outcome.outcome
+        self.schema = outcome.schema
+
+class StepPlan(object):
+    """A compiled step, with its operation resolved and its static parameters merged."""
+
+    def __init__(self, step, operation=None):
+        self.step = step
+        self.operation = operation
+
+        parameters = {}
+        if operation and operation.parameters:
+            recursive_merge(parameters, deepcopy(operation.parameters))
+        if step.parameters:
+            recursive_merge(parameters, deepcopy(step.parameters))
+
+        self.parameters = parameters
+        self.template = None
+        if parameters and operation and operation.schema:
+            self.template = Template(operation.schema, parameters)
+
+    def prepare_parameters(self, parameters=None):
+        """Returns the parameters for an initiation of this step, suitable for
+        interpolation, merging ``parameters`` over the static parameters."""
+
+        if not parameters:
+            return self.template
+
+        params = deepcopy(self.parameters)
+        recursive_merge(params, parameters)
+        return params
+
+class ExecutionPlan(object):
+    """A compiled execution plan for a workflow, which remains valid for as long as
+    the number and latest modification of the operations it resolved are
+    unchanged."""
+
+    def __init__(self, workflow, operations, stamp):
+        self.stamp = stamp
+        self.workflow = workflow
+
+        self.steps = {}
+        for name, step in workflow.steps.iteritems():
+            operation = operations.get(step.operation)
+            if operation:
+                operation = OperationPlan(operation)
+            self.steps[name] = StepPlan(step, operation)
+
+    @classmethod
+    def build(cls, session, workflow):
+        identifiers = cls._enumerate_operations(workflow)
+
+        operations = {}
+        if identifiers:
+            query = session.query(Operation).filter(Operation.id.in_(identifiers))
+            for operation in query:
+                operations[operation.id] = operation
+
+        return cls(workflow, operations, cls._stamp(session, identifiers))
+
+    def validate(self, session):
+        """Indicates whether the operations this plan resolved are unchanged."""
+
+        identifiers = self._enumerate_operations(self.workflow)
+        return self._stamp(session, identifiers) == self.stamp
+
+    @classmethod
+    def _enumerate_operations(cls, workflow):
+        identifiers = set()
+        for step in workflow.steps.itervalues():
+            if step.operation:
+                identifiers.add(step.operation)
+        return sorted(identifiers)
+
+    @classmethod
+    def _stamp(cls, session, identifiers):
+        if not identifiers:
+            return (0, None)
+
+        return tuple(session.query(func.count(Operation.id), func.max(Operation.modified))
+            .filter(Operation.id.in_(identifiers)).one())
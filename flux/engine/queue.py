@@ -4,9 +4,9 @@ from spire.mesh import MeshDependency
 from spire.schema import SchemaDependency
 
 from flux.bindings import platoon
-from flux.models import Operation
+from flux.engine.dispatcher import ProcessDispatcher
+from flux.models.operation import Operation
 
-Process = bind(platoon, 'platoon/1.0/process')
 Queue = bind(platoon, 'platoon/1.0/queue')
 
 class QueueManager(Unit):
@@ -21,16 +21,8 @@ class QueueManager(Unit):
         for operation in session.query(Operation):
             self._register_queue(operation)
 
-    def initiate(self, operation, tag, input=None, id=None, timeout=None):
-        params = {'queue_id': operation.queue_id, 'tag': tag}
-        if id is not None:
-            params['id'] = id
-        if input is not None:
-            params['input'] = input
-        if timeout is not None:
-            params['timeout'] = timeout
-
-        Process.create(**params)
+    def initiate(self, operation, tag, input=None, id=None, timeout=None, priority=None):
+        ProcessDispatcher.dispatch(operation.queue_id, tag, input, id, timeout, priority)
 
     def register(self, operation):
         self._register_queue(operation)
@@ -2,6 +2,7 @@ from mesh.exceptions import OperationError
 from scheme import *
 
 from flux.engine.action import Action
+from flux.engine.interpolation import Expression
 
 class Environment(object):
     """A rule evaluation environment."""
@@ -19,9 +20,13 @@ class Condition(Element):
     """A rule condition."""
 
     schema = Text(nonnull=True, name='condition')
+    expression = None
+
+    def compile(self):
+        self.expression = Expression(self.condition)
 
     def evaluate(self, session, environment):
-        return environment.interpolator.evaluate(self.condition)
+        return environment.interpolator.evaluate(self.expression or self.condition)
 
 class Rule(Element):
     """A workflow rule."""
@@ -33,6 +38,12 @@ class Rule(Element):
         'terminal': Boolean(nonnull=True, default=False),
     }, key_order='description condition actions terminal')
 
+    def compile(self):
+        if self.condition:
+            self.condition.compile()
+        for action in self.actions:
+            action.compile()
+
     def evaluate(self, session, environment):
         condition = self.condition
         if condition:
@@ -53,12 +64,28 @@ class Rule(Element):
             if action.action == 'execute-step':
                 if action.step not in steps:
                     raise OperationError('invalid-execute-step')
+            elif action.action == 'execute-foreach':
+                if action.step not in steps:
+                    raise OperationError('invalid-execute-foreach-step')
+                if getattr(steps[action.step], 'parallel', None):
+                    raise OperationError('invalid-execute-foreach-step')
+                if action.join and action.join not in steps:
+                    raise OperationError('invalid-execute-foreach-join')
+            elif action.action == 'wait-for':
+                if action.step not in steps:
+                    raise OperationError('invalid-wait-for-step')
+                if not (action.delay or action.topic):
+                    raise OperationError('invalid-wait-for-condition')
 
 class RuleList(Element):
     """A workflow rule list."""
 
     schema = Sequence(Rule.schema, name='rules', nonnull=True)
 
+    def compile(self):
+        for rule in self.rules:
+            rule.compile()
+
     def evaluate(self, session, environment):
         for rule in self.rules:
             if rule.evaluate(session, environment):
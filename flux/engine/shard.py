@@ -0,0 +1,113 @@
+import socket
+from datetime import timedelta
+from threading import Thread
+from time import sleep
+from uuid import UUID
+
+from scheme import Integer, Token, current_timestamp
+from spire.core import Configuration, Unit
+from spire.schema import SchemaDependency
+from spire.support.logs import LogHelper
+
+__all__ = ('ShardManager',)
+
+log = LogHelper('flux')
+
+class ShardManager(Unit):
+    """Leases shards of runs to this node, so that the callbacks of each run are
+    processed by the node which owns it. Leases are renewed periodically, spread
+    evenly across live nodes and taken over once a node ceases to renew them. A node
+    is a host unless configured otherwise, so that the processes of a host share its
+    leases, while the workers of the callback inbox claim each run they drain, so that
+    one worker across all nodes processes a run at a time. Ownership only directs
+    work; claims, the versions of runs and the delivery ledger keep processing correct
+    while leases change hands. Besides the entries of shards it has just taken over, a
+    node dispatches only entries which have waited an interval, such as those
+    received by other nodes. Sharding requires the callback inbox, through which all
+    outcomes are then directed."""
+
+    configuration = Configuration({
+        'shards': Integer(minimum=0, default=0),
+        'node': Token(),
+        'interval': Integer(minimum=1, default=5),
+        'ttl': Integer(minimum=1, default=30),
+    })
+
+    schema = SchemaDependency('flux')
+
+    active = None
+    owned = frozenset()
+    thread = None
+
+    @property
+    def node(self):
+        return self.configuration.get('node') or socket.gethostname()
+
+    def activate(self):
+        from flux.engine.inbox import CallbackInbox
+
+        if self.configuration['shards'] and not self.thread:
+            if not CallbackInbox.active:
+                log('warning', 'sharding is disabled as the callback inbox is inactive')
+                return
+
+            ShardManager.active = self
+            self.thread = Thread(target=self._maintain, name='flux-shards')
+            self.thread.daemon = True
+            self.thread.start()
+
+    @classmethod
+    def owns(cls, shard):
+        """Indicates whether this node should process work for ``shard``, which it
+        always does when sharding is disabled."""
+
+        manager = cls.active
+        return manager is None or shard is None or shard in manager.owned
+
+    @classmethod
+    def shard_of(cls, run_id):
+        """Returns the shard of the identified run, or ``None`` if sharding is
+        disabled."""
+
+        manager = cls.active
+        if manager:
+            return UUID(str(run_id)).int % manager.configuration['shards']
+
+    def _maintain(self):
+        from flux.engine.inbox import CallbackInbox
+        from flux.models import InboxEntry, ShardLease
+
+        configuration = self.configuration
+        while True:
+            session = self.schema.session
+            try:
+                owned = ShardLease.rebalance(session, self.node, configuration['shards'],
+                    configuration['ttl'])
+                gained = set(owned) - self.owned
+                if owned != self.owned:
+                    log('info', 'node %s now owns shards %s', self.node, sorted(owned))
+                self.owned = frozenset(owned)
+
+                inbox = CallbackInbox.active
+                if inbox and owned:
+                    threshold = current_timestamp() - timedelta(
+                        seconds=configuration['interval'])
+                    query = (session.query(InboxEntry.run_id).distinct()
+                        .filter(InboxEntry.shard.in_(owned))
+                        .filter(InboxEntry.retry == None))
+                    if not gained:
+                        query = query.filter(InboxEntry.received < threshold)
+                    elif gained != owned:
+                        query = query.filter(InboxEntry.shard.in_(gained) |
+                            (InboxEntry.received < threshold))
+
+                    runs = [run_id for (run_id,) in query]
+                    session.rollback()
+                    for run_id in runs:
+                        inbox.dispatch(run_id)
+            except Exception:
+                session.rollback()
+                log('exception', 'maintenance of shard leases failed')
+            finally:
+                session.close()
+            sleep(configuration['interval'])
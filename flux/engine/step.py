@@ -1,11 +1,17 @@
+from datetime import timedelta
+from random import uniform
+
+from mesh.exceptions import OperationError
 from scheme import *
-from scheme.util import recursive_merge
+from scheme import current_timestamp
 from spire.support.logs import LogHelper
 
-from flux.engine.interpolation import Interpolator
+from flux.engine.action import ExecuteForEach
+from flux.engine.interpolation import Interpolator, Template
 from flux.engine.rule import Environment, RuleList
+from flux.engine.tasks import queue_task
 from flux.exceptions import *
-from flux.models import Operation, WorkflowExecution
+from flux.models.memoization import MemoizedResult
 
 log = LogHelper('flux')
 
@@ -14,31 +20,55 @@ class Step(Element):
 
     key_attr = 'name'
     schema = Structure({
+        'cache': Structure({
+            'ttl': Integer(minimum=1, nonempty=True),
+            'key': Text(nonempty=True),
+        }),
         'description': Text(),
         'operation': Token(nonempty=True),
         'parameters': Map(Field(), nonnull=True),
+        'parallel': Structure({
+            'branches': Sequence(Token(nonempty=True), min_length=1, nonempty=True),
+            'join': Token(nonempty=True),
+            'quorum': Integer(minimum=1),
+        }),
         'preoperation': RuleList.schema,
         'postoperation': RuleList.schema,
+        'retry': Structure({
+            'attempts': Integer(minimum=2, nonempty=True),
+            'backoff': Integer(minimum=0, default=0),
+            'jitter': Integer(minimum=0, default=0),
+            'on': Sequence(Token(nonempty=True), min_length=1),
+        }),
         'timeout': Integer(),
-    }, nonnull=True, key_order=['description', 'operation', 'parameters',
-                                'preoperation', 'postoperation', 'timeout'])
+    }, nonnull=True, key_order=['description', 'operation', 'parameters', 'parallel',
+                                'preoperation', 'postoperation', 'retry', 'timeout', 'cache'])
+
+    cache_key = None
+
+    def compile(self):
+        for rulelist in ('preoperation', 'postoperation'):
+            element = getattr(self, rulelist, None)
+            if element:
+                element.compile()
+
+        cache = self.cache
+        if cache and cache.get('key'):
+            self.cache_key = Template(Field(), cache['key'])
 
     def initiate(self, session, run, ancestor=None, parameters=None, values=None):
         if not run.is_active:
             return
 
-        operation = session.query(Operation).get(self.operation)
+        if self.parallel:
+            return self._initiate_parallel(session, run, ancestor, values)
+
+        plan = run.workflow.acquire_plan(session).steps[self.name]
+        operation = plan.operation
         if not operation:
             raise UnknownOperationError(self.operation)
 
-        params = {}
-        if operation.parameters:
-            recursive_merge(params, operation.parameters)
-        if self.parameters:
-            recursive_merge(params, self.parameters)
-        if parameters:
-            recursive_merge(params, parameters)
-
+        params = plan.prepare_parameters(parameters)
         execution = run.create_execution(session, self.name, ancestor=ancestor,
             name=(self.description or operation.name))
         session.flush()
@@ -60,27 +90,50 @@ class Step(Element):
         if params:
             params = operation.schema.serialize(params)
 
+        result = None
+        if self.cache:
+            key = None
+            if self.cache_key:
+                key = interpolator.interpolate(Field(), self.cache_key)
+
+            key = MemoizedResult.generate_key(params, key)
+            execution.state = dict(execution.state or {}, cache=key)
+            result = MemoizedResult.lookup(session, operation.id, key)
+
         execution.start(params)
-        session.call_after_commit(operation.initiate, id=execution.id, tag=self.name, input=params,
-            timeout=self.timeout)
+        if result:
+            execution.state = dict(execution.state, memoized=True)
+            run.defer_processing(execution, 'completed', result.output)
+        else:
+            self._dispatch(session, operation, execution)
+        return execution
 
-    def process(self, session, execution, workflow, status, output):
-        from flux.models import Run
-        run = Run.load(session, id=execution.run_id, lockmode='update')
+    def dispatch(self, session, execution):
+        """Dispatches ``execution``, which has already been started, to its operation
+        using its stored parameters."""
+
+        operation = execution.run.workflow.acquire_plan(session).steps[self.name].operation
+        if not operation:
+            raise UnknownOperationError(self.operation)
+        self._dispatch(session, operation, execution)
 
+    def process(self, session, execution, workflow, status, output):
+        run = execution.run
         failure = False
         values = None
 
-        operation = session.query(Operation).get(self.operation)
+        operation = run.workflow.acquire_plan(session).steps[self.name].operation
         if status == 'completed':
             if output['status'] == 'valid':
                 status, outcome, values = self._parse_outcome(operation, output)
+                execution.output = output.get('values')
                 if status == 'completed':
                     if execution.status == 'aborting':
                         failure = True
                         execution.abort(session, outcome)
                     else:
                         execution.complete(session, outcome)
+                        self._memoize_result(session, operation, execution, output)
                 else:
                     failure = True
                     execution.fail(session, outcome)
@@ -97,6 +150,9 @@ class Step(Element):
             failure = True
             execution.timeout(session)
 
+        if failure and self.retry and self._retry_execution(session, run, execution):
+            return
+
         interpolator = self._construct_interpolator(run, execution)
         if values:
             interpolator['step']['out'] = values
@@ -108,6 +164,20 @@ class Step(Element):
         if postoperation:
             postoperation.evaluate(session, environment)
 
+        ancestor = execution.ancestor
+        if ancestor and ancestor.state and 'foreach' in ancestor.state:
+            if execution.state and 'index' in execution.state:
+                if environment.failure:
+                    ExecuteForEach.abandon(session, run, ancestor)
+                else:
+                    ExecuteForEach.advance(session, run, ancestor, workflow, execution)
+        elif ancestor:
+            coordinator = workflow.steps.get(ancestor.step)
+            if coordinator and coordinator.parallel:
+                if execution.step in coordinator.parallel['branches']:
+                    if coordinator._join_parallel(session, run, ancestor, workflow):
+                        environment.failure = False
+
         if environment.failure and run.is_active:
             if execution.status == 'failed':
                 return run.fail(session)
@@ -116,18 +186,15 @@ class Step(Element):
             elif execution.status == 'timedout':
                 return run.timeout(session)
 
-        if not run.active_executions.count() and run.is_active:
-            executions = run.executions
-            execution_status = WorkflowExecution.status
+        return run.conclude(session)
 
-            if executions.filter(execution_status=='failed').count():
-                return run.fail(session)
-            if executions.filter(execution_status=='timedout').count():
-                return run.timeout(session)
-            if executions.filter(execution_status=='aborted').count():
-                return run.abort(session)
-            if not executions.filter(execution_status!='completed').count():
-                return run.complete(session)
+    def resume(self, session, run, execution):
+        """Resumes the failed, timed out or aborted ``execution`` of this step by
+        dispatching a new execution with its stored parameters."""
+
+        successor = self._supersede(session, run, execution, resumed=execution.id)
+        self.dispatch(session, successor)
+        return successor
 
     def verify(self, steps):
         for rulelist in ('preoperation', 'postoperation'):
@@ -135,6 +202,14 @@ class Step(Element):
             if element:
                 element.verify(steps)
 
+        parallel = self.parallel
+        if parallel:
+            self._verify_parallel(parallel, steps)
+            if self.cache:
+                raise OperationError(token='invalid-cache-step')
+            if self.retry:
+                raise OperationError(token='invalid-retry-step')
+
     def _construct_interpolator(self, run=None, execution=None, values=None):
         interpolator = Interpolator()
         if run:
@@ -145,6 +220,131 @@ class Step(Element):
             interpolator.merge(values)
         return interpolator
 
+    def _collect_branches(self, session, run, branches):
+        plan = run.workflow.acquire_plan(session)
+        out, results = {}, {}
+
+        for branch in branches:
+            values = None
+            if branch.output and branch.outcome:
+                operation = plan.steps[branch.step].operation
+                outcome = operation.outcomes[branch.outcome]
+                values = outcome.schema.unserialize(branch.output)
+
+            results[branch.step] = {'status': branch.status, 'outcome': branch.outcome,
+                'out': values}
+            if branch.status == 'completed':
+                out[branch.step] = values
+
+        return {'step': {'out': out}, 'branches': results}
+
+    def _dispatch(self, session, operation, execution):
+        timeout = self.timeout
+        remaining = execution.run.remaining_budget()
+        if remaining is not None:
+            if remaining <= 0:
+                log('info', 'deadline of %r has passed before dispatching %r',
+                    execution.run, execution)
+                execution.run.defer_processing(execution, 'timedout', None)
+                return
+            if not timeout or remaining < timeout:
+                timeout = remaining
+
+        execution.dispatched = current_timestamp()
+        if timeout:
+            execution.deadline = execution.dispatched + timedelta(seconds=timeout)
+        else:
+            execution.deadline = None
+
+        session.call_after_commit(operation.initiate, id=execution.id, tag=self.name,
+            input=execution.parameters, timeout=timeout, priority=execution.run.priority)
+
+    def _initiate_parallel(self, session, run, ancestor=None, values=None):
+        execution = run.create_execution(session, self.name, ancestor=ancestor,
+            name=(self.description or self.name))
+        session.flush()
+        execution.start()
+
+        workflow = run.workflow.workflow
+        for branch in self.parallel['branches']:
+            workflow.steps[branch].initiate(session, run, execution, values=values)
+        return execution
+
+    def _join_parallel(self, session, run, execution, workflow):
+        """Evaluates the join barrier of this parallel step for ``execution`` after one
+        of its branches has ended, returning ``False`` if the barrier can no longer be
+        satisfied. Once the quorum is met, the failures of the other branches are
+        marked as tolerated and no longer count against the run."""
+
+        branches = [b for b in execution.descendants if not b.is_superseded]
+        if not execution.is_active:
+            if execution.status == 'completed':
+                self._tolerate_failures(run, branches)
+                return True
+            return False
+
+        parallel = self.parallel
+        required = parallel.get('quorum') or len(parallel['branches'])
+
+        completed = [b for b in branches if b.status == 'completed']
+        failed = [b for b in branches if not (b.is_active or b.status == 'completed')]
+
+        if len(completed) >= required:
+            execution.ended = current_timestamp()
+            execution.complete(session, 'completed')
+            self._tolerate_failures(run, branches)
+
+            join = parallel.get('join')
+            if join:
+                values = self._collect_branches(session, run, branches)
+                workflow.steps[join].initiate(session, run, execution, values=values)
+            return True
+        elif len(parallel['branches']) - len(failed) < required:
+            execution.ended = current_timestamp()
+            execution.fail(session, 'failed')
+            return False
+        else:
+            return True
+
+    def _memoize_result(self, session, operation, execution, output):
+        state = execution.state
+        if not (self.cache and state and 'cache' in state) or state.get('memoized'):
+            return
+
+        output = {'status': 'valid', 'outcome': output['outcome'],
+            'values': output.get('values')}
+        MemoizedResult.store(session, operation.id, state['cache'], output,
+            self.cache['ttl'])
+
+    def _retry_execution(self, session, run, execution):
+        """Schedules a retry of the failed ``execution`` as a new execution, if this
+        step's retry policy applies and attempts remain."""
+
+        retry = self.retry
+        if execution.status not in ('failed', 'timedout') or not run.is_active:
+            return False
+        if run.remaining_budget() == 0:
+            return False
+
+        on = retry.get('on') or ('failed', 'timedout')
+        if execution.status not in on and execution.outcome not in on:
+            return False
+
+        state = execution.state or {}
+        attempt = state.get('retry', {}).get('attempt', 1)
+        if attempt >= retry['attempts']:
+            return False
+
+        delay = (retry.get('backoff') or 0) * 2 ** (attempt - 1)
+        if retry.get('jitter'):
+            delay += uniform(0, retry['jitter'])
+
+        successor = self._supersede(session, run, execution,
+            retry={'attempt': attempt + 1, 'of': execution.id})
+        session.call_after_commit(queue_task, 'execution', 'retry-execution',
+            delta=int(round(delay)), priority=run.priority, id=successor.id)
+        return True
+
     def _parse_outcome(self, operation, output):
         try:
             outcome = operation.outcomes[output['outcome']]
@@ -159,3 +359,43 @@ class Step(Element):
 
         status = ('completed' if outcome.outcome == 'success' else 'failed')
         return status, outcome.name, values
+
+    def _supersede(self, session, run, execution, **values):
+        state = execution.state or {}
+        successor = run.create_execution(session, self.name, ancestor=execution.ancestor,
+            name=execution.name)
+
+        successor.state = dict((key, value) for key, value in state.iteritems()
+            if key not in ('memoized', 'resumed', 'retry'))
+        successor.state.update(values)
+        session.flush()
+
+        successor.start(execution.parameters)
+        execution.state = dict(state, retried=successor.id)
+        run.tally_execution(execution.status, 'superseded')
+        return successor
+
+    def _tolerate_failures(self, run, branches):
+        for branch in branches:
+            if branch.is_active or branch.status == 'completed':
+                continue
+            if not (branch.state and branch.state.get('tolerated')):
+                branch.state = dict(branch.state or {}, tolerated=True)
+                run.tally_execution(branch.status, None)
+
+    def _verify_parallel(self, parallel, steps):
+        if self.operation:
+            raise OperationError(token='invalid-parallel-step')
+
+        branches = parallel['branches']
+        for branch in branches:
+            if branch not in steps or steps[branch].parallel:
+                raise OperationError(token='invalid-parallel-branch')
+
+        join = parallel.get('join')
+        if join and (join not in steps or join in branches):
+            raise OperationError(token='invalid-parallel-join')
+
+        quorum = parallel.get('quorum')
+        if quorum and quorum > len(branches):
+            raise OperationError(token='invalid-parallel-quorum')
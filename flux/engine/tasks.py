@@ -0,0 +1,65 @@
+from uuid import UUID, uuid5
+
+from mesh.standard import bind
+from spire.core import Unit
+from spire.mesh import MeshDependency
+
+from flux.bindings import platoon
+
+__all__ = ('TaskScheduler', 'queue_task', 'subscribe_task')
+
+ScheduledTask = bind(platoon, 'platoon/1.0/scheduledtask')
+SubscribedTask = bind(platoon, 'platoon/1.0/subscribedtask')
+
+SUBSCRIPTION_NAMESPACE = UUID('0e8e5ab1-3b7e-4f1c-9a40-6f1f0d2c8b47')
+
+class TaskScheduler(Unit):
+    """Queues flux tasks through platoon scheduled tasks."""
+
+    flux = MeshDependency('flux')
+
+    instance = None
+    subscriptions = set()
+
+    @classmethod
+    def acquire(cls):
+        if cls.instance is None:
+            cls.instance = cls()
+        return cls.instance
+
+    def queue(self, resource, task, delta=None, priority=None, **params):
+        params['task'] = task
+        endpoint = self.flux.prepare('flux/1.0/%s' % resource, 'task', None, params)
+
+        options = {}
+        if delta:
+            options['delta'] = delta
+        if priority:
+            options['priority'] = priority
+        ScheduledTask.queue_http_task(task, endpoint, **options)
+
+    def subscribe(self, resource, task, topic):
+        """Subscribes ``task`` to every event fired on ``topic``, through one shared
+        subscription per resource, task and topic."""
+
+        key = '%s:%s:%s' % (resource, task, topic)
+        if key in self.subscriptions:
+            return
+
+        subscription = SubscribedTask(id=str(uuid5(SUBSCRIPTION_NAMESPACE, key)),
+            tag=task, topic=topic)
+        subscription.set_http_task(self.flux.prepare('flux/1.0/%s' % resource, 'task', None,
+            {'task': task}, preparation={'injections': ['event']}))
+        subscription.put()
+        self.subscriptions.add(key)
+
+def queue_task(resource, task, delta=None, priority=None, **params):
+    """Queues ``task`` for the flux ``resource``, to be executed after ``delta``
+    seconds and with ``priority`` if specified."""
+
+    TaskScheduler.acquire().queue(resource, task, delta, priority, **params)
+
+def subscribe_task(resource, task, topic):
+    """Subscribes ``task`` for the flux ``resource`` to events fired on ``topic``."""
+
+    TaskScheduler.acquire().subscribe(resource, task, topic)
@@ -0,0 +1,164 @@
+import os
+import socket
+from datetime import timedelta
+from threading import Thread
+from time import sleep
+
+from mesh.exceptions import GoneError
+from mesh.standard import bind
+from scheme import Integer, current_timestamp
+from spire.core import Configuration, Unit
+from spire.schema import SchemaDependency
+from spire.support.logs import LogHelper
+
+from flux.bindings import platoon
+from flux.engine.inbox import CallbackInbox
+from flux.engine.tasks import queue_task
+
+__all__ = ('ExecutionWatchdog',)
+
+log = LogHelper('flux')
+
+Process = bind(platoon, 'platoon/1.0/process')
+
+class ExecutionWatchdog(Unit):
+    """Periodically reconciles executions which have outlived their deadline against
+    their processes, so that executions whose callback was lost do not remain active
+    forever, and recovers the sweep of waiting executions should the task which
+    continues it have been lost. Only the process holding the watchdog lease sweeps,
+    which it renews on each sweep and which another process takes over once it
+    expires."""
+
+    configuration = Configuration({
+        'interval': Integer(minimum=0, default=300),
+        'grace': Integer(minimum=0, default=300),
+        'timeout': Integer(minimum=1, default=86400),
+        'limit': Integer(minimum=1, default=100),
+        'batches': Integer(minimum=1, default=10),
+    })
+
+    schema = SchemaDependency('flux')
+
+    thread = None
+
+    @property
+    def holder(self):
+        return '%s-%d' % (socket.gethostname(), os.getpid())
+
+    def activate(self):
+        if self.configuration['interval'] and not self.thread:
+            self.thread = Thread(target=self._watch, name='flux-watchdog')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def elect(self):
+        """Acquires or renews the watchdog lease, returning ``True`` if this process
+        holds it."""
+
+        from flux.models import Lease
+
+        session = self.schema.session
+        try:
+            return Lease.acquire(session, 'watchdog', self.holder,
+                2 * self.configuration['interval'])
+        finally:
+            session.close()
+
+    def recover_waits(self):
+        """Queues a sweep of waiting executions if one of them is overdue by more than
+        the grace period, returning ``True`` if it did."""
+
+        from flux.models import WorkflowExecution
+
+        threshold = current_timestamp() - timedelta(seconds=self.configuration['grace'])
+        session = self.schema.session
+        try:
+            overdue = (session.query(WorkflowExecution.id)
+                .filter(WorkflowExecution.status == 'waiting')
+                .filter(WorkflowExecution.wake < threshold).first())
+        finally:
+            session.close()
+
+        if overdue:
+            log('warning', 'recovering the sweep of waiting executions')
+            queue_task('execution', 'wake-executions')
+            return True
+        return False
+
+    def sweep(self, after=None):
+        """Reconciles a batch of stale executions which follow ``after``, returning
+        the ``(started, id)`` of the last one if the batch was full."""
+
+        from flux.models import WorkflowExecution
+
+        configuration = self.configuration
+        session = self.schema.session
+        try:
+            stale = [(execution.id, execution.deadline is not None, execution.started)
+                for execution in WorkflowExecution.query_stale(session,
+                    configuration['grace'], configuration['timeout'], after,
+                    configuration['limit'])]
+            session.rollback()
+
+            for id, bounded, started in stale:
+                try:
+                    self._reconcile(session, id, bounded)
+                except Exception:
+                    session.rollback()
+                    log('exception', 'reconciliation of stale execution %s failed', id)
+        finally:
+            session.close()
+
+        if len(stale) == configuration['limit']:
+            id, bounded, started = stale[-1]
+            return started, id
+
+    def _reconcile(self, session, id, bounded):
+        from flux.models import WorkflowExecution
+
+        output = None
+        try:
+            process = Process.get(id)
+        except GoneError:
+            status = 'timedout'
+        else:
+            status = process.status
+            if status in ('aborted', 'completed', 'failed', 'timedout'):
+                output = getattr(process, 'output', None)
+            elif bounded:
+                status = 'timedout'
+                try:
+                    Process.execute('update', {'status': 'aborting'}, subject=id)
+                except GoneError:
+                    pass
+            else:
+                return
+
+        log('warning', 'reconciling stale execution %s as %s', id, status)
+        if not CallbackInbox.receive(session, id, status, output):
+            WorkflowExecution.process_outcome(session, id, status, output)
+
+    def _watch(self):
+        configuration = self.configuration
+        while True:
+            sleep(configuration['interval'])
+            try:
+                if not self.elect():
+                    continue
+            except Exception:
+                log('exception', 'election of the watchdog failed')
+                continue
+
+            try:
+                after = None
+                for i in range(configuration['batches']):
+                    after = self.sweep(after)
+                    if not after:
+                        break
+            except Exception:
+                log('exception', 'sweep of stale executions failed')
+
+            try:
+                self.recover_waits()
+            except Exception:
+                log('exception', 'recovery of the sweep of waiting executions failed')
@@ -2,6 +2,7 @@ from mesh.exceptions import OperationError
 from scheme import *
 from spire.support.logs import LogHelper
 
+from flux.engine.action import ExecuteForEach, WaitFor
 from flux.engine.product import Product
 from flux.engine.rule import RuleList
 from flux.engine.step import Step
@@ -40,12 +41,58 @@ class Workflow(Element):
         'prerun': RuleList.schema,
         'postrun': RuleList.schema,
         'steps': Map(Step.schema, Token(nonempty=True), nonnull=True),
-    }, key_order='name entry parameters schema layout products prerun postrun preoperation postoperation steps')
+        'timeout': Integer(minimum=1),
+        'max_active_runs': Integer(minimum=1),
+    }, key_order='name entry timeout max_active_runs parameters schema layout products prerun postrun preoperation postoperation steps')
+
+    def compile(self):
+        for rulelist in ('preoperation', 'postoperation', 'prerun', 'postrun'):
+            element = getattr(self, rulelist, None)
+            if element:
+                element.compile()
+
+        for step in self.steps.itervalues():
+            step.compile()
 
     def initiate(self, session, run):
         log('info', 'initiating %r', run)
         self.steps[self.entry].initiate(session, run)
 
+    def resume(self, session, run):
+        """Resumes ``run`` by reactivating the parallel and foreach coordinators
+        which did not complete and resuming every other execution which did not
+        complete, leaving completed executions as they are."""
+
+        log('info', 'resuming %r', run)
+        coordinators, executions, waits = [], [], []
+        for execution in run.executions.all():
+            if execution.status == 'completed' or execution.is_superseded:
+                continue
+            if execution.state and execution.state.get('tolerated'):
+                continue
+
+            step = self.steps.get(execution.step)
+            if execution.state and 'wait' in execution.state:
+                waits.append(execution)
+            elif not step:
+                log('warning', 'cannot resume %r of unknown step', execution)
+            elif step.parallel or (execution.state and 'foreach' in execution.state):
+                coordinators.append(execution)
+            else:
+                executions.append((step, execution))
+
+        for coordinator in coordinators:
+            coordinator.reactivate(session)
+        for step, execution in executions:
+            step.resume(session, run, execution)
+        for execution in waits:
+            execution.reactivate(session)
+            WaitFor.suspend(session, execution)
+
+        for coordinator in coordinators:
+            if 'foreach' in (coordinator.state or {}):
+                ExecuteForEach.resume(session, run, coordinator, self)
+
     def verify(self):
         steps = self.steps
 
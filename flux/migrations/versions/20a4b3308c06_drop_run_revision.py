@@ -0,0 +1,23 @@
+"""drop run revision
+
+Revision: 20a4b3308c06
+Revises: 8874e024031c
+Created: 2026-10-18 16:02:11.418207
+"""
+
+revision = '20a4b3308c06'
+down_revision = '8874e024031c'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, Integer, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.drop_column('run', 'revision')
+
+def downgrade():
+    op.add_column('run', Column('revision', Integer(), nullable=True))
+    op.execute('update run set revision = 0')
+    op.alter_column('run', 'revision', nullable=False)
@@ -0,0 +1,49 @@
+"""add run execution counters
+
+Revision: 21c1a423563a
+Revises: 7f62543ddfb0
+Created: 2026-10-18 12:02:41.529310
+"""
+
+revision = '21c1a423563a'
+down_revision = '7f62543ddfb0'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, Integer, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('run', Column('executions_active', Integer(), nullable=True))
+    op.add_column('run', Column('executions_completed', Integer(), nullable=True))
+    op.add_column('run', Column('executions_failed', Integer(), nullable=True))
+    op.add_column('run', Column('executions_aborted', Integer(), nullable=True))
+    op.add_column('run', Column('executions_timedout', Integer(), nullable=True))
+    op.add_column('run', Column('executions_invalidated', Integer(), nullable=True))
+    op.execute("update run set executions_active = (select count(*) from execution"
+        " where execution.run_id = run.id and execution.status in ('aborting', 'active', 'pending', 'suspended', 'waiting'))")
+    op.execute("update run set executions_completed = (select count(*) from execution"
+        " where execution.run_id = run.id and execution.status = 'completed')")
+    op.execute("update run set executions_failed = (select count(*) from execution"
+        " where execution.run_id = run.id and execution.status = 'failed')")
+    op.execute("update run set executions_aborted = (select count(*) from execution"
+        " where execution.run_id = run.id and execution.status = 'aborted')")
+    op.execute("update run set executions_timedout = (select count(*) from execution"
+        " where execution.run_id = run.id and execution.status = 'timedout')")
+    op.execute("update run set executions_invalidated = (select count(*) from execution"
+        " where execution.run_id = run.id and execution.status = 'invalidated')")
+    op.alter_column('run', 'executions_active', nullable=False)
+    op.alter_column('run', 'executions_completed', nullable=False)
+    op.alter_column('run', 'executions_failed', nullable=False)
+    op.alter_column('run', 'executions_aborted', nullable=False)
+    op.alter_column('run', 'executions_timedout', nullable=False)
+    op.alter_column('run', 'executions_invalidated', nullable=False)
+
+def downgrade():
+    op.drop_column('run', 'executions_active')
+    op.drop_column('run', 'executions_completed')
+    op.drop_column('run', 'executions_failed')
+    op.drop_column('run', 'executions_aborted')
+    op.drop_column('run', 'executions_timedout')
+    op.drop_column('run', 'executions_invalidated')
@@ -0,0 +1,23 @@
+"""add ephemeral runs
+
+Revision: 22608762132c
+Revises: dc3a56ba827a
+Created: 2026-10-18 18:26:13.847301
+"""
+
+revision = '22608762132c'
+down_revision = 'dc3a56ba827a'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('run', Column('ephemeral', BooleanType(), nullable=True))
+    op.execute('update run set ephemeral = false')
+    op.alter_column('run', 'ephemeral', nullable=False)
+
+def downgrade():
+    op.drop_column('run', 'ephemeral')
@@ -0,0 +1,27 @@
+"""add run and execution versions
+
+Revision: 402d0a22829e
+Revises: de92732e4a0d
+Created: 2026-10-18 15:31:47.220519
+"""
+
+revision = '402d0a22829e'
+down_revision = 'de92732e4a0d'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, Integer, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('run', Column('version', Integer(), nullable=True))
+    op.add_column('execution', Column('version', Integer(), nullable=True))
+    op.execute('update run set version = 1')
+    op.execute('update execution set version = 1')
+    op.alter_column('run', 'version', nullable=False)
+    op.alter_column('execution', 'version', nullable=False)
+
+def downgrade():
+    op.drop_column('execution', 'version')
+    op.drop_column('run', 'version')
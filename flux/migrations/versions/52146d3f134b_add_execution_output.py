@@ -0,0 +1,21 @@
+"""add execution output
+
+Revision: 52146d3f134b
+Revises: bc78221bff9b
+Created: 2026-10-18 10:04:17.552910
+"""
+
+revision = '52146d3f134b'
+down_revision = 'bc78221bff9b'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('execution', Column('output', JsonType(), nullable=True))
+
+def downgrade():
+    op.drop_column('execution', 'output')
@@ -0,0 +1,23 @@
+"""add run priority
+
+Revision: 592a9accf765
+Revises: 22608762132c
+Created: 2026-10-18 19:08:31.552786
+"""
+
+revision = '592a9accf765'
+down_revision = '22608762132c'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, Integer, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('run', Column('priority', Integer(), nullable=True))
+    op.execute('update run set priority = 0')
+    op.alter_column('run', 'priority', nullable=False)
+
+def downgrade():
+    op.drop_column('run', 'priority')
@@ -0,0 +1,47 @@
+"""index execution wait aspects
+
+Revision: 63a0f92d0539
+Revises: 20a4b3308c06
+Created: 2026-10-18 16:41:27.093518
+"""
+
+revision = '63a0f92d0539'
+down_revision = '20a4b3308c06'
+
+import json
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint, text)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('execution', Column('aspect_keys', TextType(), nullable=True))
+    op.add_column('execution', Column('aspect', TextType(), nullable=True))
+
+    connection = op.get_bind()
+    fetch_waits = text("select id, state from execution"
+        " where status = 'waiting' and topic is not null")
+    update_wait = text("update execution set aspect_keys = :keys, aspect = :aspect"
+        " where id = :id")
+    for wait in connection.execute(fetch_waits).fetchall():
+        state = wait.state
+        if isinstance(state, basestring):
+            state = json.loads(state)
+
+        aspects = (state or {}).get('wait', {}).get('aspects')
+        if aspects:
+            keys = sorted(aspects)
+            connection.execute(update_wait, id=wait.id, keys=json.dumps(keys),
+                aspect=json.dumps([[key, unicode(aspects[key])] for key in keys]))
+
+    op.drop_index('execution_status_topic', 'execution')
+    op.create_index('execution_status_topic_aspect', 'execution',
+        ['status', 'topic', 'aspect'])
+
+def downgrade():
+    op.drop_index('execution_status_topic_aspect', 'execution')
+    op.create_index('execution_status_topic', 'execution', ['status', 'topic'])
+    op.drop_column('execution', 'aspect')
+    op.drop_column('execution', 'aspect_keys')
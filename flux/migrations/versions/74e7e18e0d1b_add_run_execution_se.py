@@ -0,0 +1,24 @@
+"""add run execution serial
+
+Revision: 74e7e18e0d1b
+Revises: 21c1a423563a
+Created: 2026-10-18 12:21:07.402116
+"""
+
+revision = '74e7e18e0d1b'
+down_revision = '21c1a423563a'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, Integer, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('run', Column('execution_serial', Integer(), nullable=True))
+    op.execute("update run set execution_serial = (select coalesce(max(execution_id), 0)"
+        " from execution where execution.run_id = run.id)")
+    op.alter_column('run', 'execution_serial', nullable=False)
+
+def downgrade():
+    op.drop_column('run', 'execution_serial')
@@ -0,0 +1,23 @@
+"""add run revision
+
+Revision: 754b785cd50b
+Revises: 74e7e18e0d1b
+Created: 2026-10-18 12:48:55.180442
+"""
+
+revision = '754b785cd50b'
+down_revision = '74e7e18e0d1b'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, Integer, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('run', Column('revision', Integer(), nullable=True))
+    op.execute('update run set revision = 0')
+    op.alter_column('run', 'revision', nullable=False)
+
+def downgrade():
+    op.drop_column('run', 'revision')
@@ -0,0 +1,23 @@
+"""drop memoized result hits
+
+Revision: 7c1b02178f05
+Revises: 63a0f92d0539
+Created: 2026-10-18 17:20:36.552914
+"""
+
+revision = '7c1b02178f05'
+down_revision = '63a0f92d0539'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, Integer, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.drop_column('memoized_result', 'hits')
+
+def downgrade():
+    op.add_column('memoized_result', Column('hits', Integer(), nullable=True))
+    op.execute('update memoized_result set hits = 0')
+    op.alter_column('memoized_result', 'hits', nullable=False)
@@ -0,0 +1,21 @@
+"""add execution state
+
+Revision: 7f62543ddfb0
+Revises: 52146d3f134b
+Created: 2026-10-18 11:26:03.114785
+"""
+
+revision = '7f62543ddfb0'
+down_revision = '52146d3f134b'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('execution', Column('state', JsonType(), nullable=True))
+
+def downgrade():
+    op.drop_column('execution', 'state')
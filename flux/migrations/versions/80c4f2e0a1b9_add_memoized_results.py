@@ -0,0 +1,32 @@
+"""add memoized results
+
+Revision: 80c4f2e0a1b9
+Revises: 754b785cd50b
+Created: 2026-10-18 13:20:14.663108
+"""
+
+revision = '80c4f2e0a1b9'
+down_revision = '754b785cd50b'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, Integer, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.create_table('memoized_result',
+        Column('id', UUIDType(), nullable=False),
+        Column('operation_id', TokenType(), nullable=False),
+        Column('key', TokenType(), nullable=False),
+        Column('output', JsonType(), nullable=False),
+        Column('created', DateTimeType(timezone=True), nullable=False),
+        Column('expires', DateTimeType(timezone=True), nullable=False),
+        Column('hits', Integer(), nullable=False),
+        ForeignKeyConstraint(['operation_id'], ['operation.id'], ondelete='CASCADE'),
+        PrimaryKeyConstraint('id'),
+        UniqueConstraint('operation_id','key'),
+    )
+
+def downgrade():
+    op.drop_table('memoized_result')
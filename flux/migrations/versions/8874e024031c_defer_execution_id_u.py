@@ -0,0 +1,25 @@
+"""defer execution id uniqueness
+
+Revision: 8874e024031c
+Revises: c114347218de
+Created: 2026-10-18 23:41:09.527318
+"""
+
+revision = '8874e024031c'
+down_revision = 'c114347218de'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.drop_constraint('execution_run_id_execution_id_key', 'execution')
+    op.create_unique_constraint('execution_run_id_execution_id_key', 'execution',
+        ['run_id', 'execution_id'], deferrable=True, initially='DEFERRED')
+
+def downgrade():
+    op.drop_constraint('execution_run_id_execution_id_key', 'execution')
+    op.create_unique_constraint('execution_run_id_execution_id_key', 'execution',
+        ['run_id', 'execution_id'])
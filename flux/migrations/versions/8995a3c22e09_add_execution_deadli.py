@@ -0,0 +1,25 @@
+"""add execution deadlines
+
+Revision: 8995a3c22e09
+Revises: b42a30ebc052
+Created: 2026-10-18 17:12:05.664930
+"""
+
+revision = '8995a3c22e09'
+down_revision = 'b42a30ebc052'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('execution', Column('dispatched', DateTimeType(timezone=True), nullable=True))
+    op.add_column('execution', Column('deadline', DateTimeType(timezone=True), nullable=True))
+    op.create_index('execution_status_started', 'execution', ['status', 'started'])
+
+def downgrade():
+    op.drop_index('execution_status_started', 'execution')
+    op.drop_column('execution', 'deadline')
+    op.drop_column('execution', 'dispatched')
@@ -0,0 +1,23 @@
+"""add run superseded executions
+
+Revision: 8c2a306ad607
+Revises: 80c4f2e0a1b9
+Created: 2026-10-18 14:02:37.118923
+"""
+
+revision = '8c2a306ad607'
+down_revision = '80c4f2e0a1b9'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, Integer, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('run', Column('executions_superseded', Integer(), nullable=True))
+    op.execute('update run set executions_superseded = 0')
+    op.alter_column('run', 'executions_superseded', nullable=False)
+
+def downgrade():
+    op.drop_column('run', 'executions_superseded')
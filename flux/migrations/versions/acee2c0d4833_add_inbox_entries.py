@@ -0,0 +1,33 @@
+"""add inbox entries
+
+Revision: acee2c0d4833
+Revises: 402d0a22829e
+Created: 2026-10-18 16:04:29.731066
+"""
+
+revision = 'acee2c0d4833'
+down_revision = '402d0a22829e'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.create_table('inbox_entry',
+        Column('id', UUIDType(), nullable=False),
+        Column('run_id', UUIDType(), nullable=False),
+        Column('execution_id', UUIDType(), nullable=False),
+        Column('status', TokenType(), nullable=False),
+        Column('output', JsonType(), nullable=True),
+        Column('received', DateTimeType(timezone=True), nullable=False),
+        ForeignKeyConstraint(['run_id'], ['run.id'], ondelete='CASCADE'),
+        ForeignKeyConstraint(['execution_id'], ['execution.id'], ondelete='CASCADE'),
+        PrimaryKeyConstraint('id')
+    )
+    op.create_index('inbox_entry_run_received', 'inbox_entry', ['run_id', 'received'])
+
+def downgrade():
+    op.drop_index('inbox_entry_run_received', 'inbox_entry')
+    op.drop_table('inbox_entry')
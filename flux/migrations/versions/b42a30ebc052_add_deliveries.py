@@ -0,0 +1,32 @@
+"""add deliveries
+
+Revision: b42a30ebc052
+Revises: acee2c0d4833
+Created: 2026-10-18 16:37:52.118404
+"""
+
+revision = 'b42a30ebc052'
+down_revision = 'acee2c0d4833'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.create_table('delivery',
+        Column('id', UUIDType(), nullable=False),
+        Column('execution_id', UUIDType(), nullable=False),
+        Column('status', TokenType(), nullable=False),
+        Column('delivery', TextType(), nullable=False),
+        Column('received', DateTimeType(timezone=True), nullable=False),
+        ForeignKeyConstraint(['execution_id'], ['execution.id'], ondelete='CASCADE'),
+        PrimaryKeyConstraint('id'),
+        UniqueConstraint('execution_id','status','delivery'),
+    )
+    op.add_column('inbox_entry', Column('delivery', TextType(), nullable=True))
+
+def downgrade():
+    op.drop_column('inbox_entry', 'delivery')
+    op.drop_table('delivery')
@@ -0,0 +1,23 @@
+"""add run backlog
+
+Revision: bbf1995232c9
+Revises: 592a9accf765
+Created: 2026-10-18 19:44:57.093615
+"""
+
+revision = 'bbf1995232c9'
+down_revision = '592a9accf765'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('run', Column('queued', DateTimeType(timezone=True), nullable=True))
+    op.create_index('run_workflow_queued', 'run', ['workflow_id', 'queued'])
+
+def downgrade():
+    op.drop_index('run_workflow_queued', 'run')
+    op.drop_column('run', 'queued')
@@ -0,0 +1,21 @@
+"""add operation modified
+
+Revision: bc78221bff9b
+Revises: 381ee8388179
+Created: 2026-10-18 09:12:41.318204
+"""
+
+revision = 'bc78221bff9b'
+down_revision = '381ee8388179'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('operation', Column('modified', DateTimeType(timezone=True), nullable=True))
+
+def downgrade():
+    op.drop_column('operation', 'modified')
@@ -0,0 +1,25 @@
+"""add inbox entry retries
+
+Revision: c0ca25587784
+Revises: bbf1995232c9
+Created: 2026-10-18 21:12:40.518204
+"""
+
+revision = 'c0ca25587784'
+down_revision = 'bbf1995232c9'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, Integer, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('inbox_entry', Column('attempts', Integer(), nullable=True))
+    op.execute('update inbox_entry set attempts = 0')
+    op.alter_column('inbox_entry', 'attempts', nullable=False)
+    op.add_column('inbox_entry', Column('retry', DateTimeType(timezone=True), nullable=True))
+
+def downgrade():
+    op.drop_column('inbox_entry', 'retry')
+    op.drop_column('inbox_entry', 'attempts')
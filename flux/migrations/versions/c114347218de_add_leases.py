@@ -0,0 +1,26 @@
+"""add leases
+
+Revision: c114347218de
+Revises: c0ca25587784
+Created: 2026-10-18 22:04:17.286431
+"""
+
+revision = 'c114347218de'
+down_revision = 'c0ca25587784'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.create_table('lease',
+        Column('id', TokenType(), nullable=False),
+        Column('holder', TokenType(), nullable=False),
+        Column('expires', DateTimeType(timezone=True), nullable=False),
+        PrimaryKeyConstraint('id')
+    )
+
+def downgrade():
+    op.drop_table('lease')
@@ -0,0 +1,36 @@
+"""add shard leases
+
+Revision: dc3a56ba827a
+Revises: 8995a3c22e09
+Created: 2026-10-18 17:58:40.302117
+"""
+
+revision = 'dc3a56ba827a'
+down_revision = '8995a3c22e09'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, Integer, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.create_table('shard_node',
+        Column('id', TokenType(), nullable=False),
+        Column('heartbeat', DateTimeType(timezone=True), nullable=False),
+        PrimaryKeyConstraint('id')
+    )
+    op.create_table('shard_lease',
+        Column('shard', Integer(), autoincrement=False, nullable=False),
+        Column('node', TokenType(), nullable=True),
+        Column('expires', DateTimeType(timezone=True), nullable=True),
+        PrimaryKeyConstraint('shard')
+    )
+    op.add_column('inbox_entry', Column('shard', Integer(), nullable=True))
+    op.create_index('inbox_entry_shard', 'inbox_entry', ['shard'])
+
+def downgrade():
+    op.drop_index('inbox_entry_shard', 'inbox_entry')
+    op.drop_column('inbox_entry', 'shard')
+    op.drop_table('shard_lease')
+    op.drop_table('shard_node')
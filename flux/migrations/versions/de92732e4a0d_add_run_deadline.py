@@ -0,0 +1,23 @@
+"""add run deadline
+
+Revision: de92732e4a0d
+Revises: f93a7d744cc8
+Created: 2026-10-18 15:02:11.408213
+"""
+
+revision = 'de92732e4a0d'
+down_revision = 'f93a7d744cc8'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, Integer, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('run', Column('timeout', Integer(), nullable=True))
+    op.add_column('run', Column('deadline', DateTimeType(timezone=True), nullable=True))
+
+def downgrade():
+    op.drop_column('run', 'deadline')
+    op.drop_column('run', 'timeout')
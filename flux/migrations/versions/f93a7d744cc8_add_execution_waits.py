@@ -0,0 +1,27 @@
+"""add execution waits
+
+Revision: f93a7d744cc8
+Revises: 8c2a306ad607
+Created: 2026-10-18 14:47:52.301664
+"""
+
+revision = 'f93a7d744cc8'
+down_revision = '8c2a306ad607'
+
+from alembic import op
+from spire.schema.fields import *
+from sqlalchemy import (Column, ForeignKey, ForeignKeyConstraint, PrimaryKeyConstraint,
+    CheckConstraint, UniqueConstraint)
+from sqlalchemy.dialects import postgresql
+
+def upgrade():
+    op.add_column('execution', Column('wake', DateTimeType(timezone=True), nullable=True))
+    op.add_column('execution', Column('topic', TokenType(), nullable=True))
+    op.create_index('execution_status_wake', 'execution', ['status', 'wake'])
+    op.create_index('execution_status_topic', 'execution', ['status', 'topic'])
+
+def downgrade():
+    op.drop_index('execution_status_topic', 'execution')
+    op.drop_index('execution_status_wake', 'execution')
+    op.drop_column('execution', 'topic')
+    op.drop_column('execution', 'wake')
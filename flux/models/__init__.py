@@ -1,7 +1,11 @@
 from .emailtemplate import *
 from .execution import *
+from .inbox import *
+from .lease import *
+from .memoization import *
 from .message import *
 from .operation import *
 from .request import *
 from .run import *
+from .shard import *
 from .workflow import *
\ No newline at end of file
@@ -1,24 +1,68 @@
+from collections import OrderedDict
+from datetime import timedelta
+
 from mesh.exceptions import GoneError
 from mesh.standard import bind
 from scheme import current_timestamp
 from spire.schema import *
 from spire.support.logs import LogHelper
+from sqlalchemy import Index
+from sqlalchemy.orm.exc import StaleDataError
 
 from flux.bindings import platoon
 from flux.constants import *
 
-__all__ = ('WorkflowExecution',)
+__all__ = ('Delivery', 'WorkflowExecution')
 
 log = LogHelper('flux')
 schema = Schema('flux')
 
 Process = bind(platoon, 'platoon/1.0/process')
 
+PROCESSING_ATTEMPTS = 4
+
+class Delivery(Model):
+    """A processed delivery of a status update of an execution."""
+
+    class meta:
+        constraints = [UniqueConstraint('execution_id', 'status', 'delivery')]
+        schema = schema
+        tablename = 'delivery'
+
+    id = Identifier()
+    execution_id = ForeignKey('execution.id', nullable=False, ondelete='CASCADE')
+    status = Token(nullable=False)
+    delivery = Text(nullable=False, default='')
+    received = DateTime(nullable=False, timezone=True)
+
+    @classmethod
+    def record(cls, session, execution_id, status, delivery=None):
+        """Records a delivery within the current transaction, returning ``False`` if
+        it has already been recorded."""
+
+        session.begin_nested()
+        try:
+            session.add(cls(execution_id=execution_id, status=status,
+                delivery=(delivery or ''), received=current_timestamp()))
+            session.flush()
+        except IntegrityError:
+            session.rollback()
+            return False
+        else:
+            session.commit()
+            return True
+
 class WorkflowExecution(Model):
     """A step execution."""
 
     class meta:
-        constraints = [UniqueConstraint('run_id', 'execution_id')]
+        constraints = [
+            UniqueConstraint('run_id', 'execution_id', deferrable=True,
+                initially='DEFERRED'),
+            Index('execution_status_wake', 'status', 'wake'),
+            Index('execution_status_topic_aspect', 'status', 'topic', 'aspect'),
+            Index('execution_status_started', 'status', 'started'),
+        ]
         schema = schema
         tablename = 'execution'
 
@@ -33,6 +77,17 @@ class WorkflowExecution(Model):
     started = DateTime(timezone=True)
     ended = DateTime(timezone=True)
     parameters = Json()
+    output = Json()
+    state = Json()
+    wake = DateTime(timezone=True)
+    topic = Token()
+    aspect_keys = Text()
+    aspect = Text()
+    dispatched = DateTime(timezone=True)
+    deadline = DateTime(timezone=True)
+    version = Integer(nullable=False)
+
+    __mapper_args__ = {'version_id_col': version}
 
     descendants = relationship('WorkflowExecution',
         backref=backref('ancestor', remote_side=[id]))
@@ -49,13 +104,27 @@ class WorkflowExecution(Model):
     def workflow(self):
         return self.run.workflow
 
+    @property
+    def is_coordinator(self):
+        """Indicates whether this execution coordinates the executions of a parallel
+        or foreach step, rather than being dispatched to a process."""
+
+        if self.state and 'foreach' in self.state:
+            return True
+        step = self.workflow.workflow.steps.get(self.step)
+        return bool(step and step.parallel)
+
+    @property
+    def is_superseded(self):
+        return bool(self.state and self.state.get('retried'))
+
     def abort(self, session, outcome=None):
-        self.status = 'aborted'
+        self._transition('aborted')
         if outcome:
             self.outcome = outcome
 
     def complete(self, session, outcome):
-        self.status = 'completed'
+        self._transition('completed')
         self.outcome = outcome
 
     def contribute_values(self):
@@ -70,49 +139,193 @@ class WorkflowExecution(Model):
         return execution
 
     def fail(self, session, outcome=None):
-        self.status = 'failed'
+        self._transition('failed')
         if outcome:
             self.outcome = outcome
 
     def initiate_abort(self, session):
-        if not self.is_active or self.status == 'aborting':
+        if not self.is_active:
             return
 
-        self.status = 'aborting'
+        if self.status == 'waiting' or self.is_coordinator:
+            self.ended = current_timestamp()
+            return self.abort(session)
+        elif self.status == 'aborting':
+            return
+
+        self._transition('aborting')
         try:
             Process.execute('update', {'status': 'aborting'}, subject=self.id)
         except GoneError:
             log('warning', 'no corresponding process resource for %r', self)
 
     def invalidate(self, session, errors):
-        self.status = 'invalidated'
+        self._transition('invalidated')
 
-    def process(self, session, status, output):
+    def process(self, session, status, output, lock=False):
         if not self.is_active:
             return
 
         workflow = self.workflow.workflow
         step = workflow.steps[self.step]
 
+        if lock:
+            session.refresh(self.run, lockmode='update')
+
         self.ended = current_timestamp()
+        checkpoint = self.run.checkpoint()
         session.begin_nested()
 
         try:
             step.process(session, self, workflow, status, output)
+            session.commit()
+        except StaleDataError:
+            session.rollback()
+            self.run.restore(checkpoint)
+            raise
         except Exception:
             session.rollback()
             log('exception', 'processing of %r failed due to exception', self)
+            session.expire(self.run)
+            self.run.restore(checkpoint)
             self.run.fail(session)
         else:
-            session.commit()
+            self.run.process_deferred(session)
+
+    @classmethod
+    def process_outcome(cls, session, id, status, output, delivery=None):
+        """Loads the identified execution, processes its outcome and commits. The run
+        of the execution is not locked; its counters are written as the transaction
+        commits, together with a bump of its version, so that a concurrent update of
+        it fails the commit, in which case processing is retried from scratch, with
+        the final attempt locking the run. Should that attempt conflict as well, the
+        conflict is raised, so that the outcome is delivered again rather than lost.
+        Deliveries which have already been processed are acknowledged without
+        processing them again."""
+
+        for attempt in range(1, PROCESSING_ATTEMPTS + 1):
+            try:
+                execution = cls.load(session, id=id, lockmode='update')
+            except NoResultFound:
+                return
+
+            if not Delivery.record(session, id, status, delivery):
+                log('info', 'ignoring duplicate %s delivery for %r', status, execution)
+                session.rollback()
+                return
+
+            try:
+                execution.process(session, status, output, attempt == PROCESSING_ATTEMPTS)
+                session.commit()
+            except (IntegrityError, StaleDataError):
+                session.close()
+                if attempt == PROCESSING_ATTEMPTS:
+                    log('error', 'processing of execution %s conflicted with concurrent'
+                        ' updates on every attempt', id)
+                    raise
+                log('info', 'processing of execution %s conflicted with a concurrent'
+                    ' update (attempt %d)', id, attempt)
+            else:
+                return execution
+
+    @classmethod
+    def process_batch(cls, session, updates):
+        """Processes a batch of status updates of executions, grouped by run so that
+        the updates of each run are processed in order in a single transaction which
+        locks the run once. An update which fails is rolled back on its own. Returns
+        the result of each update, which is only reported as processed or ignored
+        once the transaction which processed it has committed."""
+
+        results = ['unknown'] * len(updates)
+        ids = set(update['id'] for update in updates)
+        runs = dict(session.query(cls.id, cls.run_id).filter(cls.id.in_(ids)))
+
+        groups = OrderedDict()
+        for i, update in enumerate(updates):
+            run_id = runs.get(update['id'])
+            if run_id:
+                groups.setdefault(run_id, []).append(i)
+
+        for run_id, indexes in groups.iteritems():
+            staged = {}
+            try:
+                query = (session.query(cls).with_lockmode('update').order_by(cls.id)
+                    .filter(cls.id.in_(set(updates[i]['id'] for i in indexes))))
+                executions = dict((execution.id, execution) for execution in query)
+                if executions:
+                    session.refresh(executions.values()[0].run, lockmode='update')
+
+                for i in indexes:
+                    execution = executions.get(updates[i]['id'])
+                    if execution:
+                        staged[i] = cls._process_update(session, execution, updates[i])
+                session.commit()
+            except Exception:
+                session.rollback()
+                log('exception', 'processing of a batch of updates for run %s failed', run_id)
+                for i in indexes:
+                    results[i] = 'failed'
+            else:
+                for i, result in staged.iteritems():
+                    results[i] = result
+        return results
+
+    @classmethod
+    def query_stale(cls, session, grace, timeout, after=None, limit=100):
+        """Queries active executions which were dispatched to a process and have
+        outlived their deadline, or ``timeout`` seconds if they have none, by more
+        than ``grace`` seconds, in order of when they started. If specified, ``after``
+        is the ``(started, id)`` of the execution after which to resume."""
+
+        threshold = current_timestamp() - timedelta(seconds=grace)
+        query = (session.query(cls)
+            .filter(cls.status.in_(('aborting', 'active', 'pending')))
+            .filter(cls.started < threshold)
+            .filter(cls.dispatched != None)
+            .filter((cls.deadline < threshold) | ((cls.deadline == None) &
+                (cls.dispatched < threshold - timedelta(seconds=timeout)))))
+
+        if after:
+            started, id = after
+            query = query.filter((cls.started > started) |
+                ((cls.started == started) & (cls.id > id)))
+        return query.order_by(cls.started, cls.id).limit(limit).all()
+
+    def reactivate(self, session):
+        self._transition('active')
+        self.ended = None
+        self.outcome = None
+
+    def retry(self, session):
+        """Dispatches this execution, which retries a failed execution, once its
+        backoff has elapsed."""
+
+        if self.status == 'aborting':
+            self.ended = current_timestamp()
+            return self.abort(session)
+        elif not self.is_active:
+            return
+
+        session.refresh(self.run, lockmode='update')
+        if not self.run.is_active:
+            self.ended = current_timestamp()
+            return self.abort(session)
+
+        workflow = self.workflow.workflow
+        workflow.steps[self.step].dispatch(session, self)
+        self.run.process_deferred(session)
 
     def start(self, parameters=None):
         self.started = current_timestamp()
+        self.run.tally_execution(None, self.status)
         if parameters:
             self.parameters = parameters
 
     def timeout(self, session):
-        self.status = 'timedout'
+        self._transition('timedout')
+
+    def wait(self, session):
+        self._transition('waiting')
 
     def update(self, session, **attrs):
         task = None
@@ -129,3 +342,36 @@ class WorkflowExecution(Model):
     def update_progress(self, session, progress):
         pass
         # TODO: handle progress_update
+
+    @classmethod
+    def _process_update(cls, session, execution, update):
+        checkpoint = execution.run.checkpoint()
+        session.begin_nested()
+        try:
+            status = update['status']
+            if status == 'executing':
+                execution.update_progress(session, update.get('progress'))
+                result = 'processed'
+            elif not Delivery.record(session, execution.id, status,
+                    update.get('delivery')):
+                result = 'ignored'
+            elif execution.is_active:
+                execution.process(session, status, update.get('output'))
+                result = 'processed'
+            else:
+                result = 'ignored'
+            session.commit()
+        except StaleDataError:
+            session.rollback()
+            execution.run.restore(checkpoint)
+            raise
+        except Exception:
+            session.rollback()
+            execution.run.restore(checkpoint)
+            log('exception', 'processing of update of %r failed', execution)
+            result = 'failed'
+        return result
+
+    def _transition(self, status):
+        self.run.tally_execution(self.status, status)
+        self.status = status
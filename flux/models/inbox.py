@@ -0,0 +1,48 @@
+from scheme import current_timestamp
+from spire.schema import *
+from sqlalchemy import Index
+
+from flux.models.execution import WorkflowExecution
+
+__all__ = ('InboxEntry',)
+
+schema = Schema('flux')
+
+class InboxEntry(Model):
+    """A received outcome of an execution, awaiting processing."""
+
+    class meta:
+        constraints = [
+            Index('inbox_entry_run_received', 'run_id', 'received'),
+            Index('inbox_entry_shard', 'shard'),
+        ]
+        schema = schema
+        tablename = 'inbox_entry'
+
+    id = Identifier()
+    run_id = ForeignKey('run.id', nullable=False, ondelete='CASCADE')
+    execution_id = ForeignKey('execution.id', nullable=False, ondelete='CASCADE')
+    shard = Integer()
+    status = Token(nullable=False)
+    output = Json()
+    delivery = Text()
+    received = DateTime(nullable=False, timezone=True)
+    attempts = Integer(nullable=False, default=0)
+    retry = DateTime(timezone=True)
+
+    @classmethod
+    def create(cls, session, execution_id, status, output=None, delivery=None):
+        run_id = (session.query(WorkflowExecution.run_id)
+            .filter_by(id=execution_id).scalar())
+        if not run_id:
+            return
+
+        entry = cls(run_id=run_id, execution_id=execution_id, status=status,
+            output=output, delivery=delivery, received=current_timestamp())
+        session.add(entry)
+        return entry
+
+    @classmethod
+    def pending(cls, session, run_id, limit=50):
+        return (session.query(cls).filter_by(run_id=run_id)
+            .order_by(cls.received).limit(limit).all())
@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from scheme import current_timestamp
+from spire.schema import *
+from sqlalchemy.exc import IntegrityError
+
+__all__ = ('Lease',)
+
+schema = Schema('flux')
+
+class Lease(Model):
+    """A named lease electing the single flux process or worker which performs a
+    duty."""
+
+    class meta:
+        schema = schema
+        tablename = 'lease'
+
+    id = Token(nullable=False, primary_key=True)
+    holder = Token(nullable=False)
+    expires = DateTime(nullable=False, timezone=True)
+
+    @classmethod
+    def acquire(cls, session, id, holder, ttl):
+        """Acquires or renews the identified lease for ``holder`` for ``ttl`` seconds
+        and commits, returning ``False`` if it is held by another holder which has
+        not let it expire."""
+
+        now = current_timestamp()
+        expires = now + timedelta(seconds=ttl)
+
+        lease = session.query(cls).with_lockmode('update').get(id)
+        if not lease:
+            session.add(cls(id=id, holder=holder, expires=expires))
+            try:
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                return False
+            return True
+
+        if lease.holder != holder and lease.expires > now:
+            session.rollback()
+            return False
+
+        lease.holder, lease.expires = holder, expires
+        session.commit()
+        return True
+
+    @classmethod
+    def release(cls, session, id, holder):
+        """Releases the identified lease if it is held by ``holder`` and commits."""
+
+        session.query(cls).filter_by(id=id, holder=holder).delete(synchronize_session=False)
+        session.commit()
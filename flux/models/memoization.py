@@ -0,0 +1,76 @@
+import json
+from datetime import timedelta
+from hashlib import sha1
+from threading import Lock
+
+from scheme import current_timestamp
+from spire.schema import *
+from spire.support.logs import LogHelper
+
+__all__ = ('MemoizedResult',)
+
+schema = Schema('flux')
+log = LogHelper('flux')
+
+REPORT_INTERVAL = 100
+
+class MemoizedResult(Model):
+    """A memoized result of a successful operation execution."""
+
+    class meta:
+        constraints = [UniqueConstraint('operation_id', 'key')]
+        schema = schema
+        tablename = 'memoized_result'
+
+    guard = Lock()
+    statistics = {'hits': 0, 'misses': 0}
+
+    id = Identifier()
+    operation_id = ForeignKey('operation.id', nullable=False, ondelete='CASCADE')
+    key = Token(nullable=False)
+    output = Json(nullable=False)
+    created = DateTime(nullable=False, timezone=True)
+    expires = DateTime(nullable=False, timezone=True)
+
+    @classmethod
+    def generate_key(cls, parameters, key=None):
+        serialized = json.dumps({'parameters': parameters, 'key': key},
+            sort_keys=True, default=unicode)
+        return sha1(serialized).hexdigest()
+
+    @classmethod
+    def lookup(cls, session, operation_id, key):
+        """Looks up the unexpired result memoized for ``operation_id`` and ``key``.
+        Hits and misses are counted in this process, without writing to the result,
+        and reported to the log every ``REPORT_INTERVAL`` lookups."""
+
+        result = (session.query(cls).filter_by(operation_id=operation_id, key=key)
+            .filter(cls.expires > current_timestamp()).first())
+
+        statistics = cls.statistics
+        with cls.guard:
+            statistics['hits' if result else 'misses'] += 1
+            hits, misses = statistics['hits'], statistics['misses']
+
+        log('debug', 'memoized result %s for %s', ('hit' if result else 'miss'),
+            operation_id)
+        if (hits + misses) % REPORT_INTERVAL == 0:
+            log('info', 'memoized results: %d hits, %d misses', hits, misses)
+        return result
+
+    @classmethod
+    def store(cls, session, operation_id, key, output, ttl):
+        now = current_timestamp()
+        query = session.query(cls).filter_by(operation_id=operation_id)
+        query.filter((cls.expires <= now) | (cls.key == key)).delete(
+            synchronize_session=False)
+
+        session.begin_nested()
+        try:
+            session.add(cls(operation_id=operation_id, key=key, output=output,
+                created=now, expires=now + timedelta(seconds=ttl)))
+            session.flush()
+        except IntegrityError:
+            session.rollback()
+        else:
+            session.commit()
@@ -1,14 +1,14 @@
-from mesh.standard import bind
+from scheme import current_timestamp
 from spire.mesh import Definition, MeshDependency
 from spire.schema import *
+from spire.support.logs import LogHelper
 from sqlalchemy.orm.collections import attribute_mapped_collection
 
-from flux.bindings import platoon
 from flux.constants import *
+from flux.engine.dispatcher import ProcessDispatcher
 
 schema = Schema('flux')
-
-Process = bind(platoon, 'platoon/1.0/process')
+log = LogHelper('flux')
 
 class Operation(Model):
     """A workflow operation."""
@@ -23,6 +23,7 @@ class Operation(Model):
     description = Text()
     schema = Definition()
     parameters = Json()
+    modified = DateTime(timezone=True)
 
     outcomes = relationship('Outcome', backref='operation',
         collection_class=attribute_mapped_collection('name'),
@@ -34,7 +35,7 @@ class Operation(Model):
 
     @classmethod
     def create(cls, session, outcomes, **attrs):
-        operation = cls(**attrs)
+        operation = cls(modified=current_timestamp(), **attrs)
 
         for name, outcome in outcomes.iteritems():
             outcome = Outcome(name=name, **outcome)
@@ -43,15 +44,8 @@ class Operation(Model):
         session.add(operation)
         return operation
 
-    def initiate(self, tag, input=None, id=None, timeout=None):
-        params = {'queue_id': self.queue_id, 'tag': tag}
-        if id is not None:
-            params['id'] = id
-        if input is not None:
-            params['input'] = input
-        if timeout is not None:
-            params['timeout'] = timeout
-        return Process.create(**params)
+    def initiate(self, tag, input=None, id=None, timeout=None, priority=None):
+        ProcessDispatcher.dispatch(self.queue_id, tag, input, id, timeout, priority)
 
     def update(self, session, outcomes=None, **attrs):
         self.update_with_mapping(**attrs)
@@ -66,6 +60,8 @@ class Operation(Model):
                 if name not in outcomes:
                     del collection[name]
 
+        self.modified = current_timestamp()
+
 class Outcome(Model):
     """An operation outcome."""
 
@@ -1,12 +1,22 @@
+from collections import OrderedDict
+from copy import deepcopy
+from datetime import timedelta
+from itertools import chain
+from threading import Lock
+
 from mesh.standard import bind, OperationError, ValidationError
 from scheme import current_timestamp
 from spire.mesh import Surrogate
 from spire.schema import *
 from spire.support.logs import LogHelper
+from sqlalchemy import Index, event, func
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy.orm.collections import attribute_mapped_collection
 
 from flux.bindings import platoon
 from flux.constants import *
+from flux.engine.tasks import queue_task
 from flux.models.execution import WorkflowExecution
 from flux.models.workflow import Workflow
 
@@ -30,21 +40,68 @@ class Product(Model):
     token = Token(nullable=False)
     product = Surrogate(nullable=False)
 
+class RunCache(object):
+    """A bounded cache of the processed parameters of runs. Entries are keyed on the
+    parameters they were processed from, so that a stale or rolled back entry is
+    never served, and the environment of a run is composed anew on each lookup."""
+
+    def __init__(self, capacity=1024):
+        self.cache = OrderedDict()
+        self.capacity = capacity
+        self.guard = Lock()
+
+    def acquire(self, run, workflow):
+        with self.guard:
+            entry = self.cache.pop(run.id, None)
+            if entry and entry[0] is workflow and entry[1] == run.parameters:
+                self.cache[run.id] = entry
+                return entry[2]
+
+        entry = (workflow, deepcopy(run.parameters), run._process_parameters(workflow))
+        with self.guard:
+            self.cache[run.id] = entry
+            while len(self.cache) > self.capacity:
+                self.cache.popitem(last=False)
+        return entry[2]
+
+    def discard(self, run):
+        with self.guard:
+            self.cache.pop(run.id, None)
+
 class Run(Model):
     """A workflow run."""
 
     class meta:
+        constraints = [Index('run_workflow_queued', 'workflow_id', 'queued')]
         schema = schema
         tablename = 'run'
 
+    cache = RunCache()
+
     id = Identifier()
     workflow_id = ForeignKey('workflow.id', nullable=False)
     name = Text(nullable=False)
     status = Enumeration(RUN_STATUSES, nullable=False, default='pending')
     parameters = Json()
     environment = Json()
+    ephemeral = Boolean(nullable=False, default=False)
+    priority = Integer(nullable=False, default=0)
+    timeout = Integer()
     started = DateTime(timezone=True)
     ended = DateTime(timezone=True)
+    deadline = DateTime(timezone=True)
+    queued = DateTime(timezone=True)
+    executions_active = Integer(nullable=False, default=0)
+    executions_completed = Integer(nullable=False, default=0)
+    executions_failed = Integer(nullable=False, default=0)
+    executions_aborted = Integer(nullable=False, default=0)
+    executions_timedout = Integer(nullable=False, default=0)
+    executions_invalidated = Integer(nullable=False, default=0)
+    executions_superseded = Integer(nullable=False, default=0)
+    execution_serial = Integer(nullable=False, default=0)
+    version = Integer(nullable=False)
+
+    __mapper_args__ = {'version_id_col': version}
 
     executions = relationship(WorkflowExecution, backref='run',
         cascade='all,delete-orphan', lazy='dynamic', passive_deletes=True,
@@ -66,55 +123,143 @@ class Run(Model):
     def is_active(self):
         return self.status in ACTIVE_RUN_STATUSES.split(' ')
 
-    @property
-    def next_execution_id(self):
-        return len(self.executions.all()) + 1
+    def admit(self, session):
+        """Initiates this run, or resumes it if it was initiated before, if its
+        workflow admits another active run, and otherwise holds it in the backlog of
+        its workflow, returning whether it was admitted. This run is locked here,
+        after its workflow if that limits its active runs, in the order in which
+        ``admit_queued()`` locks them."""
+
+        limit = self.workflow.workflow.max_active_runs
+        if limit:
+            Workflow.load(session, id=self.workflow_id, lockmode='update')
+        session.refresh(self, lockmode='update')
+
+        if limit and self._count_admitted(session, self.workflow_id, self.id) >= limit:
+            if not self.queued:
+                log('info', 'queueing %r in the backlog of its workflow', self)
+                self.queued = current_timestamp()
+            return False
+
+        self.queued = None
+        self._proceed(session)
+        return True
+
+    @classmethod
+    def admit_queued(cls, session, workflow_id):
+        """Initiates or resumes the runs queued in the backlog of the identified
+        workflow, by priority and then in order of arrival, for as long as it admits
+        them."""
+
+        try:
+            workflow = Workflow.load(session, id=workflow_id, lockmode='update')
+        except NoResultFound:
+            return
+
+        query = (session.query(cls).with_lockmode('update')
+            .filter_by(workflow_id=workflow_id).filter(cls.queued != None)
+            .order_by(cls.priority.desc(), cls.queued))
+
+        limit = workflow.workflow.max_active_runs
+        if limit:
+            available = limit - cls._count_admitted(session, workflow_id)
+            if available <= 0:
+                return
+            query = query.limit(available)
+
+        for run in query.all():
+            run.queued = None
+            run._proceed(session)
+
+    @classmethod
+    def backlog_reaches(cls, session, limit):
+        """Indicates whether at least ``limit`` runs are queued in the backlogs of
+        workflows, without counting every queued run."""
+
+        query = session.query(cls.id).filter(cls.queued != None)
+        return query.offset(limit - 1).limit(1).first() is not None
 
     def abort_executions(self, session):
         for execution in self.active_executions.all():
+            checkpoint = self.checkpoint()
             session.begin_nested()
             try:
                 session.refresh(execution, lockmode='update')
                 execution.initiate_abort(session)
             except Exception:
                 session.rollback()
+                self.restore(checkpoint)
             else:
                 session.commit()
 
     def associate_product(self, token, product):
         self.products[token] = Product(product=product, token=token)
 
+    def checkpoint(self):
+        """Returns the changes to the counters of this run pending in the current
+        transaction, so that they can be restored with ``restore()`` once a savepoint
+        begun after this call has been rolled back."""
+
+        pending = self.__dict__.get('_pending')
+        if pending is not None:
+            return dict(pending)
+
+    def compact(self, session):
+        """Deletes the executions of this run if it is ephemeral and completed
+        successfully, leaving this run, its counters and its products as the record
+        of it. Only runs of services may be ephemeral. Their executions are kept
+        while they are active, so that any node can process them, and are deleted by
+        a task queued once the run completes, so a completed ephemeral run may still
+        list its executions until that task has run."""
+
+        if self.ephemeral and self.status == 'completed':
+            self.executions.delete(synchronize_session=False)
+
     def complete(self, session):
         self._end_run(session, 'completed')
+        if self.ephemeral:
+            session.call_after_commit(queue_task, 'run', 'compact-run', id=self.id)
+
+    def conclude(self, session):
+        """Ends this run according to the statuses of its executions, once none of
+        them is active."""
+
+        if self.count_executions('active') or not self.is_active:
+            return
+
+        if self.count_executions('failed'):
+            return self.fail(session)
+        if self.count_executions('timedout'):
+            return self.timeout(session)
+        if self.count_executions('aborted'):
+            return self.abort(session)
+        if not self.count_executions('invalidated'):
+            return self.complete(session)
 
     def contribute_values(self):
         run = {'id': self.id, 'name': self.name, 'started': self.started}
-        if self.environment:
-            parameters = self.environment.copy()
-        else:
-            parameters = {}
-
         workflow = self.workflow.workflow
-        if workflow.parameters:
-            parameters.update(workflow.parameters)
+        run['env'] = self._construct_environment(workflow)
+        return {'run': run}
 
-        if self.parameters:
-            if workflow.schema:
-                parameters.update(workflow.schema.process(self.parameters,
-                    serialized=True, partial=True))
-            else:
-                parameters.update(self.parameters)
+    def count_executions(self, status):
+        """Returns the number of executions of this run counted as ``status``,
+        including changes pending in the current transaction."""
 
-        run['env'] = parameters
-        return {'run': run}
+        return self._count('executions_%s' % status)
 
     @classmethod
-    def create(cls, session, workflow_id, name=None, parameters=None, **attrs):
+    def create(cls, session, workflow_id, name=None, parameters=None, inline=False, **attrs):
         try:
             workflow = Workflow.load(session, id=workflow_id)
         except NoResultFound:
             raise OperationError('unknown-workflow')
 
+        if inline and (not workflow.is_service or attrs.get('status') == 'prepared'):
+            raise OperationError(token='invalid-inline-run')
+        if attrs.get('ephemeral') and not workflow.is_service:
+            raise OperationError(token='invalid-ephemeral-run')
+
         workflow_schema = workflow.workflow.schema
         if workflow_schema and parameters:
             workflow_schema.process(parameters, serialized=True, partial=True)
@@ -129,11 +274,31 @@ class Run(Model):
         session.add(run)
         return run
 
+    def allocate_execution_id(self):
+        """Allocates the next serial execution id for this run. Like its counters, the
+        serial is only written once the transaction commits."""
+
+        self._adjust(execution_serial=1)
+        return self._count('execution_serial')
+
     def create_execution(self, session, step, parameters=None, ancestor=None, name=None):
         return WorkflowExecution.create(
-                session, run_id=self.id, execution_id=self.next_execution_id,
+                session, run_id=self.id, execution_id=self.allocate_execution_id(),
                 ancestor=ancestor, step=step, name=name, parameters=parameters)
 
+    def defer_processing(self, execution, status, output):
+        """Defers processing of ``execution`` with the specified ``status`` and ``output``
+        until the processing currently under way for this run has finished."""
+
+        deferred = self.__dict__.setdefault('_deferred', [])
+        deferred.append((execution, status, output))
+
+    def discard_deferred(self):
+        """Discards deferred processing, once the changes which deferred it have been
+        rolled back."""
+
+        self.__dict__.pop('_deferred', None)
+
     def fail(self, session):
         self._end_run(session, 'failed')
         self.abort_executions(session)
@@ -146,6 +311,8 @@ class Run(Model):
 
     def initiate(self, session):
         self.started = current_timestamp()
+        self._establish_deadline(self.started)
+        checkpoint = self.checkpoint()
         session.begin_nested()
 
         try:
@@ -153,9 +320,11 @@ class Run(Model):
         except Exception:
             log('exception', 'initiation of %r failed due to exception', self)
             session.rollback()
+            self.restore(checkpoint)
             self.invalidate(session)
         else:
             session.commit()
+            self.process_deferred(session)
 
     def abort(self, session):
         self._end_run(session, 'aborted')
@@ -178,11 +347,21 @@ class Run(Model):
         status = attrs.get('status')
         if status:
             if status == 'pending':
-                if self.status != 'prepared':
+                if self.status in RESUMABLE_RUN_STATUSES.split(' '):
+                    self._end_coordinators(session)
+                    if self.count_executions('active'):
+                        raise ValidationError('invalid-transition')
+                    task = 'resume'
+                elif self.status != 'prepared':
                     raise ValidationError('invalid-transition')
-                task = 'initiate'
+                else:
+                    task = 'initiate'
             elif status == 'aborting':
-                if self.is_active:
+                if self.queued:
+                    attrs.pop('status')
+                    self.queued = None
+                    self.abort(session)
+                elif self.is_active:
                     task = 'abort'
                 elif self.status != 'aborting':
                     raise ValidationError('invalid-transition')
@@ -190,6 +369,92 @@ class Run(Model):
         self.update_with_mapping(attrs, ignore='id')
         return task
 
+    def process_deferred(self, session):
+        """Processes executions whose processing was deferred, in order."""
+
+        deferred = self.__dict__.get('_deferred')
+        if not deferred or self.__dict__.get('_processing_deferred'):
+            return
+
+        self._processing_deferred = True
+        try:
+            while deferred:
+                execution, status, output = deferred.pop(0)
+                session.flush()
+                execution.process(session, status, output)
+        finally:
+            self._processing_deferred = False
+
+    def remaining_budget(self):
+        """Returns the number of whole seconds remaining before the deadline of this
+        run, which is zero or less once it has passed, or ``None`` if this run has no
+        deadline."""
+
+        if self.deadline:
+            remaining = (self.deadline - current_timestamp()).total_seconds()
+            return max(int(remaining), 0)
+
+    def restore(self, checkpoint):
+        """Restores the pending changes to the counters of this run to ``checkpoint``
+        and discards deferred processing, once the savepoint which changed them has
+        been rolled back."""
+
+        if checkpoint is None:
+            self.__dict__.pop('_pending', None)
+        else:
+            self.__dict__['_pending'] = checkpoint
+        self.discard_deferred()
+
+    def resume(self, session):
+        self.ended = None
+        self._establish_deadline(current_timestamp())
+        checkpoint = self.checkpoint()
+        session.begin_nested()
+
+        try:
+            self.workflow.workflow.resume(session, self)
+        except Exception:
+            log('exception', 'resumption of %r failed due to exception', self)
+            session.rollback()
+            self.restore(checkpoint)
+            self.fail(session)
+        else:
+            session.commit()
+            if not self.ephemeral:
+                session.call_after_commit(self._run_changed_event, 'run:changed')
+            self.conclude(session)
+            self.process_deferred(session)
+
+    def settle(self):
+        """Writes the changes to the counters of this run pending in the current
+        transaction, which happens as it commits. The write bumps the version of this
+        run, so the commit fails with ``StaleDataError`` if another transaction has
+        updated this run since it was read; what was decided and dispatched on the
+        basis of that read is then rolled back rather than committed."""
+
+        pending = self.__dict__.pop('_pending', None)
+        if not pending:
+            return
+
+        for name, delta in pending.iteritems():
+            setattr(self, name, (getattr(self, name) or 0) + delta)
+        flag_modified(self, name)
+
+    def tally_execution(self, previous, status):
+        """Updates the execution counters of this run for an execution of it which
+        is transitioning from ``previous`` status to ``status``."""
+
+        previous, status = self._count_as(previous), self._count_as(status)
+        if previous == status:
+            return
+
+        deltas = {}
+        if previous:
+            deltas['executions_%s' % previous] = -1
+        if status:
+            deltas['executions_%s' % status] = 1
+        self._adjust(**deltas)
+
     def update_environment(self, parameters):
         environment = {}
         if self.environment:
@@ -198,11 +463,87 @@ class Run(Model):
         environment.update(parameters)
         self.environment = environment
 
+    def _adjust(self, **deltas):
+        """Adjusts the counters of this run by ``deltas`` once the current transaction
+        commits, so that the row of this run is neither written nor locked while the
+        transaction is under way."""
+
+        pending = self.__dict__.setdefault('_pending', {})
+        for name, delta in deltas.iteritems():
+            pending[name] = pending.get(name, 0) + delta
+
+    def _construct_environment(self, workflow):
+        if self.environment:
+            parameters = self.environment.copy()
+        else:
+            parameters = {}
+
+        if workflow.parameters:
+            parameters.update(workflow.parameters)
+
+        if self.parameters:
+            if workflow.schema:
+                parameters.update(self.cache.acquire(self, workflow))
+            else:
+                parameters.update(self.parameters)
+        return parameters
+
+    def _process_parameters(self, workflow):
+        return workflow.schema.process(self.parameters, serialized=True, partial=True)
+
+    def _count(self, name):
+        return (getattr(self, name) or 0) + self.__dict__.get('_pending', {}).get(name, 0)
+
+    @classmethod
+    def _count_admitted(cls, session, workflow_id, excluding=None):
+        query = (session.query(cls).filter_by(workflow_id=workflow_id)
+            .filter(cls.status.in_(ACTIVE_RUN_STATUSES.split(' ')))
+            .filter(cls.started != None).filter(cls.queued == None))
+
+        if excluding:
+            query = query.filter(cls.id != excluding)
+        return query.count()
+
+    @staticmethod
+    def _count_as(status):
+        if status in ACTIVE_RUN_STATUSES.split(' '):
+            return 'active'
+        else:
+            return status
+
+    def _establish_deadline(self, start):
+        timeout = self.timeout or self.workflow.workflow.timeout
+        if timeout:
+            self.deadline = start + timedelta(seconds=timeout)
+
+    def _end_coordinators(self, session):
+        """Ends the coordinators this run, which has ended, left active. Unlike the
+        executions they coordinate, they have no process which would end them."""
+
+        for execution in self.active_executions.all():
+            if execution.is_coordinator:
+                execution.ended = current_timestamp()
+                execution.abort(session)
+
     def _end_run(self, session, status):
         self.status = status
         self.ended = current_timestamp()
-        session.call_after_commit(self._run_changed_event, 'run:changed')
+        self.cache.discard(self)
+        if not self.ephemeral:
+            session.call_after_commit(self._run_changed_event, 'run:changed')
         session.call_after_commit(self._run_changed_event, 'run:ended')
+        if self.workflow.workflow.max_active_runs:
+            priority = (session.query(func.max(Run.priority))
+                .filter_by(workflow_id=self.workflow_id).filter(Run.queued != None)
+                .scalar())
+            session.call_after_commit(queue_task, 'run', 'admit-runs',
+                priority=priority, workflow_id=self.workflow_id)
+
+    def _proceed(self, session):
+        if self.started:
+            self.resume(session)
+        else:
+            self.initiate(session)
 
     def _run_changed_event(self, topic):
         try:
@@ -211,3 +552,17 @@ class Run(Model):
             log('exception', 'failed to fire %s event', topic)
         else:
             log('info', 'fired off %s event for %r', topic, self)
+
+@event.listens_for(Session, 'before_commit')
+def _settle_runs(session):
+    if not session.transaction.nested:
+        for instance in chain(session.identity_map.values(), session.new):
+            if isinstance(instance, Run):
+                instance.settle()
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending_changes(session, transaction):
+    if not transaction.nested:
+        for instance in session.identity_map.values():
+            if isinstance(instance, Run):
+                instance.__dict__.pop('_pending', None)
@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from scheme import current_timestamp
+from spire.schema import *
+from spire.support.logs import LogHelper
+
+__all__ = ('ShardLease', 'ShardNode')
+
+schema = Schema('flux')
+log = LogHelper('flux')
+
+class ShardNode(Model):
+    """A flux node participating in sharded processing of runs."""
+
+    class meta:
+        schema = schema
+        tablename = 'shard_node'
+
+    id = Token(nullable=False, primary_key=True)
+    heartbeat = DateTime(nullable=False, timezone=True)
+
+class ShardLease(Model):
+    """A lease of a shard of runs held by a flux node."""
+
+    class meta:
+        schema = schema
+        tablename = 'shard_lease'
+
+    shard = Integer(nullable=False, primary_key=True, autoincrement=False)
+    node = Token()
+    expires = DateTime(timezone=True)
+
+    @classmethod
+    def rebalance(cls, session, node, shards, ttl):
+        """Renews the leases held by ``node`` and claims or releases leases so that
+        the ``shards`` shards are spread evenly across live nodes, returning the set
+        of shards now leased to ``node``. Leases of nodes which failed to renew them
+        within ``ttl`` seconds are taken over."""
+
+        now = current_timestamp()
+        expires = now + timedelta(seconds=ttl)
+
+        session.merge(ShardNode(id=node, heartbeat=now))
+        nodes = (session.query(ShardNode.id)
+            .filter(ShardNode.heartbeat > now - timedelta(seconds=ttl)).count())
+
+        leases = dict((lease.shard, lease) for lease in session.query(cls)
+            .with_lockmode('update').order_by(cls.shard))
+        for shard in range(shards):
+            if shard not in leases:
+                leases[shard] = cls(shard=shard)
+                session.add(leases[shard])
+
+        target = -(-shards // max(nodes, 1))
+        owned = set()
+        for shard, lease in sorted(leases.iteritems()):
+            if lease.node == node and shard < shards:
+                if len(owned) < target:
+                    lease.expires = expires
+                    owned.add(shard)
+                else:
+                    lease.node = lease.expires = None
+
+        for shard, lease in sorted(leases.iteritems()):
+            if len(owned) >= target:
+                break
+            if shard < shards and (not lease.node or lease.expires <= now):
+                if lease.node:
+                    log('info', 'taking over shard %d from node %s', shard, lease.node)
+                lease.node, lease.expires = node, expires
+                owned.add(shard)
+
+        session.commit()
+        return owned
@@ -8,6 +8,7 @@ from flux.bindings import docket
 from sqlalchemy.orm.collections import attribute_mapped_collection
 from spire.support.logs import LogHelper
 
+from flux.engine.plan import ExecutionPlan
 from flux.engine.workflow import Workflow as WorkflowElement
 
 __all__ = ('Workflow', 'WorkflowMule')
@@ -16,8 +17,14 @@ schema = Schema('flux')
 log = LogHelper('flux')
 
 class WorkflowCache(object):   
+    """Caches compiled workflow elements and their execution plans. A cached plan
+    is validated against the operations it resolved each time it is acquired, so
+    that changes made to them by any process are seen, and rebuilt once they have
+    changed."""
+
     def __init__(self):
         self.cache = {}
+        self.plans = {}
 
     def acquire(self, workflow):
         try:
@@ -32,9 +39,19 @@ class WorkflowCache(object):
 
     def instantiate(self, workflow):
         element = WorkflowElement.unserialize(workflow.specification)
+        element.compile()
         self.cache[workflow.id] = (workflow.modified, element)
         return element
 
+    def acquire_plan(self, session, workflow):
+        element = self.acquire(workflow)
+        plan = self.plans.get(workflow.id)
+        if plan and plan.workflow is element and plan.validate(session):
+            return plan
+
+        plan = self.plans[workflow.id] = ExecutionPlan.build(session, element)
+        return plan
+
 class Workflow(Model):
     """A workflow."""
 
@@ -60,6 +77,9 @@ class Workflow(Model):
     @property
     def workflow(self):
         return self.cache.acquire(self)
+
+    def acquire_plan(self, session):
+        return self.cache.acquire_plan(session, self)
     
     @property
     def policies(self):
@@ -9,6 +9,7 @@ class MediateSurrogates(Operation):
 
     id = 'flux:mediate-surrogates'
     endpoint = ('flux/1.0/operation', 'operation')
+    inprocess = True
     operation = {
         'id': 'flux:mediate-surrogates',
         'name': 'Mediate Surrogates',
@@ -37,6 +37,14 @@ class Execution(Resource):
                 'abort-run': {
                     'id': UUID(nonempty=True),
                 },
+                'retry-execution': {
+                    'id': UUID(nonempty=True),
+                },
+                'wake-executions': {
+                    'event': Structure({
+                        'topic': Text(nonempty=True),
+                    }, nonnull=True, strict=False),
+                },
             },
             nonempty=True, polymorphic_on='task')
         responses = {
@@ -56,12 +56,36 @@ class Operation(Resource):
             'status': Enumeration('executing aborted completed failed timedout', nonnull=True),
             'output': Field(),
             'progress': Field(),
+            'delivery': Text(),
         }, nonempty=True)
         responses = {
             OK: Response(),
             INVALID: Response(Errors),
         }
 
+    class process_batch:
+        endpoint = ('PROCESS', 'operation')
+        title = 'Processing a batch of process status updates'
+        schema = Structure({
+            'processes': Sequence(Structure({
+                'id': UUID(nonempty=True),
+                'status': Enumeration('executing aborted completed failed timedout',
+                    nonnull=True),
+                'output': Field(),
+                'progress': Field(),
+                'delivery': Text(),
+            }), min_length=1, nonempty=True),
+        }, nonempty=True)
+        responses = {
+            OK: Response({
+                'results': Sequence(Structure({
+                    'id': UUID(nonempty=True),
+                    'result': Enumeration('processed ignored unknown failed', nonempty=True),
+                }), nonempty=True),
+            }),
+            INVALID: Response(Errors),
+        }
+
     class task:
         endpoint = ('TASK', 'operation')
         title = 'Initiating an operation task'
@@ -17,9 +17,14 @@ class Run(Resource):
         name = Text(operators='equal')
         status = Enumeration(RUN_STATUSES)
         parameters = Field(onupdate=False)
+        ephemeral = Boolean(default=False, onupdate=False, deferred=True)
+        priority = Integer(minimum=0, maximum=100, default=0, onupdate=False, deferred=True)
+        timeout = Integer(minimum=1, onupdate=False, deferred=True)
         products = Map(Surrogate(nonempty=True), Token(nonempty=True), readonly=True)
         started = DateTime(utc=True, readonly=True)
         ended = DateTime(utc=True, readonly=True)
+        deadline = DateTime(utc=True, readonly=True, deferred=True)
+        queued = DateTime(utc=True, readonly=True, deferred=True)
         executions = Sequence(Structure({
             'id': UUID(nonempty=True),
             'execution_id': Integer(),
@@ -34,8 +39,10 @@ class Run(Resource):
     class create(Resource.create):
         support_returning = True
         fields = {
+            'execute': Enumeration('inline queued', nonnull=True),
             'notify': Email(nonnull=True, min_length=1, multiple=True),
             'status': Enumeration('prepared pending', nonnull=True),
+            'wait': Integer(minimum=1, maximum=60),
         }
 
     class update(Resource.update):
@@ -53,9 +60,18 @@ class Run(Resource):
                 'abort-executions': {
                     'id': UUID(nonempty=True),
                 },
+                'admit-runs': {
+                    'workflow_id': UUID(nonempty=True),
+                },
+                'compact-run': {
+                    'id': UUID(nonempty=True),
+                },
                 'initiate-run': {
                     'id': UUID(nonempty=True),
                 },
+                'resume-run': {
+                    'id': UUID(nonempty=True),
+                },
                 'run-completion' : {
                     'id': UUID(nonempty=True),
                     'notify': Text(nonempty=True)
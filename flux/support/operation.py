@@ -1,6 +1,7 @@
 class OperationMixin(object):
     """A mixin to support a flux operation implementation."""
 
+    inprocess = False
     operation = None
     process = None
 
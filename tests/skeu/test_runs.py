@@ -1,13 +1,25 @@
+from contextlib import contextmanager
+from datetime import timedelta
+from Queue import PriorityQueue
 from time import sleep
 
-from scheme import fields, Yaml
+from scheme import current_timestamp, fields, Yaml
 from spire.core import adhoc_configure, Unit
 from spire.schema import SchemaDependency
+from sqlalchemy import event
+from sqlalchemy.orm.exc import StaleDataError
 from mesh.testing import MeshTestCase
-from mesh.exceptions import InvalidError 
+from mesh.exceptions import GoneError, InvalidError
 
 from flux.bundles import API
-from flux.models import Operation, Run, Workflow
+from flux.engine.action import WaitFor
+from flux.engine.dispatcher import Process, ProcessDispatcher
+from flux.engine.executor import LOCAL_OPERATIONS, LocalExecutor, register_local_operation
+from flux.engine.inbox import CallbackInbox
+from flux.engine.watchdog import ExecutionWatchdog
+from flux.models import (Delivery, InboxEntry, Lease, MemoizedResult, Operation, Run,
+    ShardLease, ShardNode, Workflow, WorkflowExecution)
+from flux.models.execution import PROCESSING_ATTEMPTS
 
 
 adhoc_configure({
@@ -82,8 +94,10 @@ class BaseTestCase(MeshTestCase):
         return run
 
     def _setup_active_run(self, client, workflow_id,
-            steps=None, parameters=None, limit=5, wait=6):
+            steps=None, parameters=None, limit=5, wait=6, priority=None):
         data = {'workflow_id': workflow_id, 'parameters': parameters}
+        if priority is not None:
+            data['priority'] = priority
         resp = client.execute('run', 'create', data=data)
         self.assertEqual('OK', resp.status)
         run_id = resp.content['id']
@@ -1538,3 +1552,1665 @@ class TestInvalidRunCase(BaseTestCase):
             ],
         }
         self.assertEquals(result, expected)
+
+
+class TestParallelRuns(BaseTestCase):
+    """Tests workflow runs with parallel steps"""
+    def test_parallel_join(self, client):
+        """Tests a parallel step joining its branches"""
+        name = 'test parallel join'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'description': 'parallel step',
+                    'parallel': {
+                        'branches': ['step-1', 'step-2'],
+                        'join': 'step-3',
+                    },
+                },
+                'step-1': {
+                    'operation': 'flux:test-operation',
+                    'description': 'first branch',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+                'step-2': {
+                    'operation': 'flux:test-operation',
+                    'description': 'second branch',
+                    'parameters': {'outcome': 'completed', 'duration': 3},
+                },
+                'step-3': {
+                    'operation': 'flux:test-operation',
+                    'description': 'join step',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id)
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+
+        result = self._poll_run_status(client, run_id, 'completed', include=['executions'])
+        executions = dict((e['step'], e) for e in result['executions'])
+        self.assertEquals(4, len(executions))
+
+        parallel_id = executions['step-0']['id']
+        for step in ('step-1', 'step-2', 'step-3'):
+            self.assertEquals('completed', executions[step]['status'])
+            self.assertEquals(parallel_id, executions[step]['ancestor_id'])
+        self.assertTrue(executions['step-3']['started'] >= executions['step-2']['ended'])
+
+    def test_parallel_quorum(self, client):
+        """Tests a parallel step joining once its quorum completes"""
+        name = 'test parallel quorum'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'parallel': {
+                        'branches': ['step-1', 'step-2'],
+                        'join': 'step-3',
+                        'quorum': 1,
+                    },
+                },
+                'step-1': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'failed', 'duration': 1},
+                },
+                'step-2': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+                'step-3': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id)
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+
+        result = self._poll_run_status(client, run_id, 'completed', include=['executions'])
+        statuses = dict((e['step'], e['status']) for e in result['executions'])
+        self.assertEquals({
+            'step-0': 'completed',
+            'step-1': 'failed',
+            'step-2': 'completed',
+            'step-3': 'completed',
+        }, statuses)
+
+
+    def test_parallel_concurrent_branches(self, client):
+        """Tests a parallel step joining branches which complete concurrently"""
+        name = 'test parallel concurrent branches'
+        branches = ['step-%d' % i for i in range(1, 7)]
+        steps = {
+            'step-0': {
+                'description': 'parallel step',
+                'parallel': {'branches': branches, 'join': 'step-7'},
+            },
+            'step-7': {
+                'operation': 'flux:test-operation',
+                'description': 'join step',
+                'parameters': {'outcome': 'completed', 'duration': 1},
+            },
+        }
+        for branch in branches:
+            steps[branch] = {
+                'operation': 'flux:test-operation',
+                'parameters': {'outcome': 'completed', 'duration': 2},
+            }
+
+        specification = Yaml.serialize({'name': name, 'entry': 'step-0', 'steps': steps})
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id)
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+
+        result = self._poll_run_status(client, run_id, 'completed', include=['executions'])
+        executions = result['executions']
+        self.assertEquals(8, len(executions))
+        self.assertEquals(1, len([e for e in executions if e['step'] == 'step-7']))
+        for execution in executions:
+            self.assertEquals('completed', execution['status'])
+
+    def test_parallel_abort(self, client):
+        """Tests aborting a run ends the coordinator of its parallel step"""
+        name = 'test parallel abort'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'parallel': {'branches': ['step-1', 'step-2']},
+                },
+                'step-1': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 30},
+                },
+                'step-2': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 30},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        run = self._setup_active_run(client, workflow_id, ('step-1', 'step-2'))
+        self._runs.append(run['id'])
+        resp = client.execute('run', 'update', subject=run['id'],
+            data={'status': 'aborting'})
+        self.assertEquals('OK', resp.status)
+
+        result = self._poll_run_status(client, run['id'], 'aborted', include=['executions'])
+        statuses = dict((e['step'], e['status']) for e in result['executions'])
+        self.assertEquals({
+            'step-0': 'aborted',
+            'step-1': 'aborted',
+            'step-2': 'aborted',
+        }, statuses)
+
+class TestConcurrentProcessing(BaseTestCase):
+    """Tests processing of execution outcomes under concurrent updates of runs"""
+    def test_version_conflict(self, client):
+        """Tests processing is retried from scratch after a concurrent update of the run"""
+        name = 'test version conflict'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 30},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        run = self._setup_active_run(client, workflow_id, ('step-0',))
+        self._runs.append(run['id'])
+        execution_id = run['executions'][0]['id']
+
+        session = self.config.schema.session
+        conflicts = []
+
+        output = {'status': 'valid', 'outcome': 'completed', 'values': {}}
+        with self._conflicting_update(session, run['id'], conflicts):
+            execution = WorkflowExecution.process_outcome(session, execution_id,
+                'completed', output, 'test-version-conflict')
+
+        self.assertEquals(1, len(conflicts))
+        self.assertEquals('completed', execution.status)
+        self.assertEquals('completed', session.query(Run).get(run['id']).status)
+        self.assertEquals(1, session.query(Delivery).filter_by(
+            execution_id=execution_id, delivery='test-version-conflict').count())
+        session.rollback()
+
+
+    def test_ended_run_is_not_advanced(self, client):
+        """Tests no further step is dispatched for a run ended by a concurrent update"""
+        name = 'test concurrently ended run'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 30},
+                    'postoperation': [{
+                        'actions': [{
+                            'action': 'execute-step',
+                            'step': 'step-1',
+                        }],
+                    }],
+                },
+                'step-1': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        run = self._setup_active_run(client, workflow_id, ('step-0',))
+        self._runs.append(run['id'])
+        execution_id = run['executions'][0]['id']
+
+        session = self.config.schema.session
+        conflicts = []
+
+        output = {'status': 'valid', 'outcome': 'completed', 'values': {}}
+        with self._conflicting_update(session, run['id'], conflicts, status='failed'):
+            WorkflowExecution.process_outcome(session, execution_id, 'completed', output)
+
+        self.assertEquals(1, len(conflicts))
+        result = session.query(Run).get(run['id'])
+        self.assertEquals('failed', result.status)
+        self.assertEquals(['step-0'], [e.step for e in result.executions])
+        self.assertEquals(1, result.execution_serial)
+        session.rollback()
+
+    def test_persistent_conflict(self, client):
+        """Tests an outcome which conflicts on every attempt is not acknowledged"""
+        name = 'test persistent conflict'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 30},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        run = self._setup_active_run(client, workflow_id, ('step-0',))
+        self._runs.append(run['id'])
+        execution_id = run['executions'][0]['id']
+
+        attempts = []
+
+        def conflict(mapper, connection, target):
+            if target.id == execution_id:
+                attempts.append(target.status)
+                raise StaleDataError('simulated conflict')
+
+        session = self.config.schema.session
+        output = {'status': 'valid', 'outcome': 'completed', 'values': {}}
+        event.listen(WorkflowExecution, 'before_update', conflict)
+        try:
+            with self.assertRaises(StaleDataError):
+                WorkflowExecution.process_outcome(session, execution_id, 'completed',
+                    output, 'test-persistent-conflict')
+        finally:
+            event.remove(WorkflowExecution, 'before_update', conflict)
+
+        self.assertEquals(PROCESSING_ATTEMPTS, len(attempts))
+        self.assertEquals('active', session.query(WorkflowExecution).get(execution_id).status)
+        self.assertEquals(0, session.query(Delivery).filter_by(execution_id=execution_id,
+            delivery='test-persistent-conflict').count())
+        session.rollback()
+
+    @contextmanager
+    def _conflicting_update(self, session, run_id, conflicts, **values):
+        """Updates the identified run through another connection as soon as it has
+        been loaded for processing, as a concurrent transaction would."""
+
+        connection = session.get_bind(Run.__mapper__).connect()
+        table = Run.__table__
+
+        def conflict(target, context):
+            if not conflicts and target.id == run_id:
+                conflicts.append(target.version)
+                connection.execute(table.update().where(table.c.id == target.id)
+                    .values(version=table.c.version + 1, **values))
+
+        event.listen(Run, 'load', conflict)
+        try:
+            yield
+        finally:
+            event.remove(Run, 'load', conflict)
+            connection.close()
+
+
+class TestCallbackInbox(BaseTestCase):
+    """Tests processing of execution outcomes received through the inbox"""
+    def _setup_inbox_entry(self, client, name):
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 30},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        run = self._setup_active_run(client, workflow_id, ('step-0',))
+        self._runs.append(run['id'])
+
+        session = self.config.schema.session
+        output = {'status': 'valid', 'outcome': 'completed', 'values': {}}
+        entry = InboxEntry.create(session, run['executions'][0]['id'], 'completed',
+            output, name)
+        entry.received = current_timestamp() - timedelta(seconds=600)
+        session.commit()
+        return run['id'], entry.id
+
+    def test_recovery_of_abandoned_entries(self, client):
+        """Tests entries left behind by a worker which ceased are recovered"""
+        run_id, entry_id = self._setup_inbox_entry(client, 'test inbox recovery')
+
+        CallbackInbox()._recover()
+        self._poll_run_status(client, run_id, 'completed', wait=2)
+
+        session = self.config.schema.session
+        self.assertIsNone(session.query(InboxEntry).get(entry_id))
+        session.rollback()
+
+    def test_retry_after_failed_processing(self, client):
+        """Tests an entry whose processing failed is kept and retried"""
+        run_id, entry_id = self._setup_inbox_entry(client, 'test inbox retry')
+        failures = []
+
+        def fail(mapper, connection, target):
+            if not failures:
+                failures.append(target.execution_id)
+                raise RuntimeError('simulated failure')
+
+        inbox = CallbackInbox()
+        event.listen(Delivery, 'before_insert', fail)
+        try:
+            inbox._drain(run_id)
+        finally:
+            event.remove(Delivery, 'before_insert', fail)
+
+        session = self.config.schema.session
+        entry = session.query(InboxEntry).get(entry_id)
+        self.assertEquals(1, len(failures))
+        self.assertEquals(1, entry.attempts)
+        self.assertTrue(entry.retry > current_timestamp())
+        self.assertEquals('pending', session.query(Run).get(run_id).status)
+
+        entry.retry = current_timestamp() - timedelta(seconds=1)
+        session.commit()
+
+        inbox._drain(run_id)
+        session = self.config.schema.session
+        self.assertIsNone(session.query(InboxEntry).get(entry_id))
+        self.assertEquals('completed', session.query(Run).get(run_id).status)
+        session.rollback()
+
+
+    def test_claimed_run_is_left_to_its_claimant(self, client):
+        """Tests the entries of a run claimed by another worker are left to it"""
+        run_id, entry_id = self._setup_inbox_entry(client, 'test inbox claim')
+        claim = 'inbox:%s' % run_id
+
+        session = self.config.schema.session
+        self.assertTrue(Lease.acquire(session, claim, 'another-worker', 300))
+
+        inbox = CallbackInbox()
+        inbox._drain(run_id)
+
+        session = self.config.schema.session
+        self.assertIsNotNone(session.query(InboxEntry).get(entry_id))
+        self.assertEquals('pending', session.query(Run).get(run_id).status)
+
+        past = current_timestamp() - timedelta(seconds=1)
+        session.query(Lease).filter_by(id=claim).update({'expires': past})
+        session.commit()
+
+        inbox._drain(run_id)
+        session = self.config.schema.session
+        self.assertIsNone(session.query(InboxEntry).get(entry_id))
+        self.assertIsNone(session.query(Lease).get(claim))
+        self.assertEquals('completed', session.query(Run).get(run_id).status)
+        session.rollback()
+
+class TestShardLeases(BaseTestCase):
+    """Tests the rebalancing of shard leases across nodes"""
+    def tearDown(self):
+        session = self.config.schema.session
+        session.query(ShardLease).delete()
+        session.query(ShardNode).delete()
+        session.commit()
+        super(TestShardLeases, self).tearDown()
+
+    def _cease(self, session, node):
+        past = current_timestamp() - timedelta(seconds=60)
+        session.query(ShardNode).filter_by(id=node).update({'heartbeat': past})
+        session.query(ShardLease).filter_by(node=node).update({'expires': past})
+        session.commit()
+
+    def test_node_join(self, client):
+        """Tests shards are spread across a node which joins"""
+        session = self.config.schema.session
+        self.assertEquals(set([0, 1, 2, 3]), ShardLease.rebalance(session, 'node-a', 4, 30))
+
+        self.assertEquals(set(), ShardLease.rebalance(session, 'node-b', 4, 30))
+        self.assertEquals(set([0, 1]), ShardLease.rebalance(session, 'node-a', 4, 30))
+        self.assertEquals(set([2, 3]), ShardLease.rebalance(session, 'node-b', 4, 30))
+        self.assertEquals(set([0, 1]), ShardLease.rebalance(session, 'node-a', 4, 30))
+
+    def test_node_leave(self, client):
+        """Tests the shards of a node which ceases are taken over once they expire"""
+        session = self.config.schema.session
+        ShardLease.rebalance(session, 'node-a', 4, 30)
+        ShardLease.rebalance(session, 'node-b', 4, 30)
+        ShardLease.rebalance(session, 'node-a', 4, 30)
+        self.assertEquals(set([2, 3]), ShardLease.rebalance(session, 'node-b', 4, 30))
+
+        self._cease(session, 'node-b')
+        self.assertEquals(set([0, 1, 2, 3]), ShardLease.rebalance(session, 'node-a', 4, 30))
+
+    def test_expired_lease(self, client):
+        """Tests an expired lease of a live node is taken over by another node"""
+        session = self.config.schema.session
+        ShardLease.rebalance(session, 'node-a', 4, 30)
+
+        past = current_timestamp() - timedelta(seconds=60)
+        session.query(ShardLease).filter_by(shard=3).update({'expires': past})
+        session.commit()
+
+        self.assertEquals(set([3]), ShardLease.rebalance(session, 'node-b', 4, 30))
+        self.assertEquals(set([0, 1]), ShardLease.rebalance(session, 'node-a', 4, 30))
+        self.assertEquals(set([2, 3]), ShardLease.rebalance(session, 'node-b', 4, 30))
+
+
+class TestForEachRuns(BaseTestCase):
+    """Tests workflow runs with foreach actions"""
+    def test_foreach_join(self, client):
+        """Tests a foreach action with bounded concurrency and a join step"""
+        name = 'test foreach join'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                    'postoperation': [{
+                        'actions': [{
+                            'action': 'execute-foreach',
+                            'step': 'step-1',
+                            'sequence': '${run.env.outcomes}',
+                            'parameters': {'outcome': '${item}'},
+                            'max_concurrency': 2,
+                            'join': 'step-2',
+                        }],
+                    }],
+                },
+                'step-1': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'duration': 1},
+                },
+                'step-2': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        parameters = {'outcomes': ['completed', 'completed', 'completed']}
+        resp = self._setup_run(client, workflow_id, parameters=parameters)
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+
+        result = self._poll_run_status(client, run_id, 'completed', include=['executions'])
+        executions = result['executions']
+        self.assertEquals(6, len(executions))
+        self.assertEquals(['step-0', 'step-1', 'step-1', 'step-1', 'step-1', 'step-2'],
+            sorted(e['step'] for e in executions))
+        for execution in executions:
+            self.assertEquals('completed', execution['status'])
+
+        elements = [e for e in executions if e['name'] != 'step-1 (foreach)' and e['step'] == 'step-1']
+        elements.sort(key=lambda e: e['started'])
+        self.assertTrue(elements[2]['started'] >= min(elements[0]['ended'], elements[1]['ended']))
+
+        session = self.config.schema.session
+        coordinator = (session.query(WorkflowExecution)
+            .filter_by(run_id=run_id, name='step-1 (foreach)').one())
+        state = coordinator.state['foreach']
+        self.assertEquals(0, state['active'])
+        self.assertEquals(['completed'] * 3, [r['status'] for r in state['results']])
+        self.assertEquals(['completed'] * 3,
+            [i['item'] for i in coordinator.output['items']])
+        session.rollback()
+
+
+    def test_foreach_element_failure(self, client):
+        """Tests a failed foreach element fails its coordinator and the run"""
+        name = 'test foreach element failure'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                    'postoperation': [{
+                        'actions': [{
+                            'action': 'execute-foreach',
+                            'step': 'step-1',
+                            'sequence': '${run.env.outcomes}',
+                            'parameters': {'outcome': '${item}'},
+                            'max_concurrency': 1,
+                            'join': 'step-2',
+                        }],
+                    }],
+                },
+                'step-1': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'duration': 1},
+                },
+                'step-2': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        parameters = {'outcomes': ['failed', 'completed']}
+        resp = self._setup_run(client, workflow_id, parameters=parameters)
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+
+        result = self._poll_run_status(client, run_id, 'failed', include=['executions'])
+        executions = result['executions']
+        self.assertEquals(['step-0', 'step-1', 'step-1'],
+            sorted(e['step'] for e in executions))
+
+        statuses = dict((e['name'], e['status']) for e in executions if e['step'] == 'step-1')
+        self.assertEquals('failed', statuses['step-1 (foreach)'])
+        self.assertEquals(['failed', 'failed'], sorted(statuses.values()))
+
+    def test_foreach_empty_sequence(self, client):
+        """Tests a foreach action over an empty sequence proceeds to its join step"""
+        name = 'test foreach empty sequence'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                    'postoperation': [{
+                        'actions': [{
+                            'action': 'execute-foreach',
+                            'step': 'step-1',
+                            'sequence': '${run.env.outcomes}',
+                            'join': 'step-2',
+                        }],
+                    }],
+                },
+                'step-1': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'duration': 1},
+                },
+                'step-2': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id, parameters={'outcomes': []})
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+
+        result = self._poll_run_status(client, run_id, 'completed', include=['executions'])
+        executions = result['executions']
+        self.assertEquals(['step-0', 'step-1', 'step-2'],
+            sorted(e['step'] for e in executions))
+        for execution in executions:
+            self.assertEquals('completed', execution['status'])
+
+class TestLocalExecution(BaseTestCase):
+    """Tests workflow runs with operations executed in-process"""
+    def test_local_operation(self, client):
+        """Tests a step of a local operation completes without a process"""
+        operation_id = 'flux:test-local-operation'
+        resp = client.execute('operation', 'create', None, data={
+            'id': operation_id,
+            'name': 'Test Local Operation',
+            'phase': 'operation',
+            'outcomes': {'completed': {'outcome': 'success'}},
+        })
+        self.assertEquals('OK', resp.status)
+        self._operations.append(operation_id)
+
+        def implementation(session, data):
+            return {'status': 'completed', 'output': {'status': 'valid',
+                'outcome': 'completed', 'values': {}}}
+
+        register_local_operation(operation_id, implementation)
+        LocalExecutor().activate()
+        try:
+            name = 'test local operation'
+            specification = Yaml.serialize({
+                'name': name,
+                'entry': 'step-0',
+                'steps': {'step-0': {'operation': operation_id}},
+            })
+            resp = self._setup_workflow(client, name, specification)
+            self.assertEquals('OK', resp.status)
+            workflow_id = resp.content['id']
+
+            resp = self._setup_run(client, workflow_id)
+            self.assertEquals('OK', resp.status)
+            result = self._poll_run_status(client, resp.content['id'], 'completed',
+                include=['executions'])
+        finally:
+            LocalExecutor.active = None
+            LOCAL_OPERATIONS.pop(operation_id, None)
+
+        execution = result['executions'][0]
+        self.assertEquals('completed', execution['status'])
+        with self.assertRaises(GoneError):
+            Process.get(execution['id'])
+
+
+class TestExecutionCounters(BaseTestCase):
+    """Tests the execution counters maintained on runs"""
+    def test_counters_on_completion(self, client):
+        """Tests the counters of a run which completed after two steps"""
+        name = 'test execution counters'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                    'postoperation': [{
+                        'actions': [{
+                            'action': 'execute-step',
+                            'step': 'step-1',
+                        }],
+                    }],
+                },
+                'step-1': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id)
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+
+        self._poll_run_status(client, run_id, 'completed')
+
+        session = self.config.schema.session
+        run = session.query(Run).get(run_id)
+        session.refresh(run)
+        self.assertEquals(0, run.executions_active)
+        self.assertEquals(2, run.executions_completed)
+        self.assertEquals(0, run.executions_failed)
+        self.assertEquals(0, run.executions_invalidated)
+        self.assertEquals(2, run.execution_serial)
+
+    def test_environment_update(self, client):
+        """Tests steps see environment updates of a run with parameters"""
+        name = 'test environment update'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                    'postoperation': [{
+                        'actions': [
+                            {
+                                'action': 'update-environment',
+                                'parameters': {'result': 'completed'},
+                            },
+                            {
+                                'action': 'execute-step',
+                                'step': 'step-1',
+                            },
+                        ],
+                    }],
+                },
+                'step-1': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': '${run.env.result}', 'duration': 1},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id, parameters={'value': 1})
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+
+        self._poll_run_status(client, run_id, 'completed')
+
+        session = self.config.schema.session
+        run = session.query(Run).get(run_id)
+        session.refresh(run)
+        self.assertEquals({'result': 'completed'}, run.environment)
+        self.assertEquals('completed', run.contribute_values()['run']['env']['result'])
+
+
+class TestExecutionPlans(BaseTestCase):
+    """Tests caching of workflow execution plans"""
+    def test_plan_rebuilt_after_operation_update(self, client):
+        """Tests the plan of a workflow is rebuilt once an operation it uses changes"""
+        resp = self._setup_workflow(client, 'test plan rebuild')
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        session = self.config.schema.session
+        workflow = session.query(Workflow).get(workflow_id)
+        plan = workflow.acquire_plan(session)
+        self.assertIs(plan, workflow.acquire_plan(session))
+
+        resp = client.execute('operation', 'get', 'flux:test-operation')
+        self.assertEquals('OK', resp.status)
+        original = resp.content.get('parameters') or {}
+
+        resp = client.execute('operation', 'update', 'flux:test-operation',
+            data={'parameters': {'duration': 1}})
+        self.assertEquals('OK', resp.status)
+        try:
+            session.expire_all()
+            rebuilt = workflow.acquire_plan(session)
+            self.assertIsNot(plan, rebuilt)
+            self.assertEquals({'duration': 1}, rebuilt.steps['step-0'].parameters)
+        finally:
+            client.execute('operation', 'update', 'flux:test-operation',
+                data={'parameters': original})
+            session.rollback()
+
+
+class TestMemoizedRuns(BaseTestCase):
+    """Tests workflow runs with memoized steps"""
+    def test_memoized_step(self, client):
+        """Tests a second run reuses the memoized result of a step"""
+        name = 'test memoized step'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 2},
+                    'cache': {'ttl': 600, 'key': '${run.env.key}'},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        parameters = {'key': 'test memoized step'}
+        resp = self._setup_run(client, workflow_id, parameters=parameters, name='memoized 1')
+        self.assertEquals('OK', resp.status)
+        first = self._poll_run_status(client, resp.content['id'], 'completed',
+            include=['executions'])
+
+        resp = self._setup_run(client, workflow_id, parameters=parameters, name='memoized 2')
+        self.assertEquals('OK', resp.status)
+        second = self._poll_run_status(client, resp.content['id'], 'completed',
+            include=['executions'])
+
+        self.assertEquals(first['executions'][0]['outcome'],
+            second['executions'][0]['outcome'])
+
+        session = self.config.schema.session
+        results = session.query(MemoizedResult).filter_by(
+            operation_id='flux:test-operation').all()
+        try:
+            self.assertEquals(1, len(results))
+            execution = session.query(WorkflowExecution).get(second['executions'][0]['id'])
+            self.assertTrue(execution.state.get('memoized'))
+        finally:
+            for result in results:
+                session.delete(result)
+            session.commit()
+
+
+class TestRetryRuns(BaseTestCase):
+    """Tests workflow runs with step retry policies"""
+    def test_retry_exhausted(self, client):
+        """Tests a failing step is retried until its attempts are exhausted"""
+        name = 'test retry exhausted'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'failed', 'duration': 1},
+                    'retry': {'attempts': 3, 'backoff': 1, 'on': ['failed']},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id)
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+
+        result = self._poll_run_status(client, run_id, 'failed', include=['executions'])
+        executions = result['executions']
+        self.assertEquals(3, len(executions))
+        for execution in executions:
+            self.assertEquals('step-0', execution['step'])
+            self.assertEquals('failed', execution['status'])
+
+        session = self.config.schema.session
+        run = session.query(Run).get(run_id)
+        session.refresh(run)
+        self.assertEquals(1, run.executions_failed)
+        self.assertEquals(2, run.executions_superseded)
+
+
+class TestResumeRuns(BaseTestCase):
+    """Tests resumption of failed workflow runs"""
+    def test_resume_failed_step(self, client):
+        """Tests resuming a failed run only executes the step which failed"""
+        name = 'test resume failed step'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                    'postoperation': [{
+                        'actions': [{
+                            'action': 'execute-step',
+                            'step': 'step-1',
+                        }],
+                    }],
+                },
+                'step-1': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'failed', 'duration': 1},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id)
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+        self._poll_run_status(client, run_id, 'failed')
+
+        resp = client.execute('run', 'update', run_id, {'status': 'pending'})
+        self.assertEquals('OK', resp.status)
+
+        sleep(6)
+        result = self._poll_run_status(client, run_id, 'failed', include=['executions'])
+        executions = result['executions']
+        self.assertEquals(['step-0', 'step-1', 'step-1'],
+            sorted(e['step'] for e in executions))
+        self.assertEquals('completed', executions[0]['status'])
+
+        session = self.config.schema.session
+        run = session.query(Run).get(run_id)
+        session.refresh(run)
+        self.assertEquals(1, run.executions_superseded)
+        self.assertEquals(1, run.executions_failed)
+
+
+    def test_resume_failed_parallel_step(self, client):
+        """Tests resuming a run which failed inside a parallel step"""
+        name = 'test resume failed parallel step'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'parallel': {'branches': ['step-1', 'step-2']},
+                },
+                'step-1': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'failed', 'duration': 1},
+                },
+                'step-2': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 5},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id)
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+        self._poll_run_status(client, run_id, 'failed')
+        sleep(6)
+
+        resp = client.execute('run', 'update', run_id, {'status': 'pending'})
+        self.assertEquals('OK', resp.status)
+
+        sleep(6)
+        result = self._poll_run_status(client, run_id, 'failed', include=['executions'])
+        executions = result['executions']
+        self.assertEquals(['step-0', 'step-1', 'step-1', 'step-2', 'step-2'],
+            sorted(e['step'] for e in executions))
+        for execution in executions:
+            self.assertNotIn(execution['status'], ('aborting', 'active', 'pending'))
+
+        session = self.config.schema.session
+        run = session.query(Run).get(run_id)
+        session.refresh(run)
+        self.assertEquals(0, run.executions_active)
+
+class TestWaitForRuns(BaseTestCase):
+    """Tests workflow runs with wait-for actions"""
+    def test_wait_for_delay(self, client):
+        """Tests a wait-for action initiates its step once the delay elapsed"""
+        name = 'test wait for delay'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                    'postoperation': [{
+                        'actions': [{
+                            'action': 'wait-for',
+                            'step': 'step-1',
+                            'delay': 3,
+                        }],
+                    }],
+                },
+                'step-1': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id)
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+
+        result = self._poll_run_status(client, run_id, 'completed', include=['executions'])
+        executions = result['executions']
+        self.assertEquals(['step-0', 'step-1 (wait)', 'step-1'], [e['name'] for e in executions])
+        for execution in executions:
+            self.assertEquals('completed', execution['status'])
+
+        waited = executions[1]
+        self.assertTrue((waited['ended'] - waited['started']).total_seconds() >= 3)
+
+    def _setup_waiting_run(self, client, name, wait):
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                    'postoperation': [{
+                        'actions': [dict(wait, action='wait-for', step='step-1')],
+                    }],
+                },
+                'step-1': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id)
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+
+        session = self.config.schema.session
+        for attempt in range(10):
+            execution = (session.query(WorkflowExecution)
+                .filter_by(run_id=run_id, status='waiting').first())
+            session.rollback()
+            if execution:
+                return run_id, execution.id
+            sleep(1)
+        raise Exception('Run(id=%s) is not waiting' % run_id)
+
+    def test_wait_for_topic(self, client):
+        """Tests a wait-for action is woken only by an event matching its aspects"""
+        run_id, execution_id = self._setup_waiting_run(client, 'test wait for topic',
+            {'topic': 'test:waited', 'aspects': {'run': '${run.id}'}})
+
+        session = self.config.schema.session
+        WaitFor.dispatch_event(session, {'topic': 'test:waited', 'run': 'another'})
+        session.commit()
+        self.assertEquals('waiting', session.query(WorkflowExecution).get(execution_id).status)
+        session.rollback()
+
+        WaitFor.dispatch_event(session, {'topic': 'test:waited', 'run': run_id})
+        session.commit()
+
+        result = self._poll_run_status(client, run_id, 'completed', include=['executions'])
+        self.assertEquals(['step-0', 'step-1 (wait)', 'step-1'],
+            [e['name'] for e in result['executions']])
+
+    def test_recovery_of_lost_sweep(self, client):
+        """Tests the watchdog recovers the sweep of overdue waiting executions"""
+        run_id, execution_id = self._setup_waiting_run(client, 'test wait sweep recovery',
+            {'delay': 3600})
+
+        session = self.config.schema.session
+        overdue = current_timestamp() - timedelta(seconds=3600)
+        (session.query(WorkflowExecution).filter_by(id=execution_id)
+            .update({'wake': overdue}, synchronize_session=False))
+        session.commit()
+
+        self.assertTrue(ExecutionWatchdog().recover_waits())
+        self._poll_run_status(client, run_id, 'completed')
+
+
+class TestRunDeadlines(BaseTestCase):
+    """Tests workflow runs bounded by a deadline"""
+    def test_run_deadline(self, client):
+        """Tests a run times out once its deadline has passed"""
+        name = 'test run deadline'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'timeout': 100,
+                    'parameters': {'duration': 100},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = client.execute('run', 'create', None,
+            data={'workflow_id': workflow_id, 'timeout': 2})
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+        self._runs.append(run_id)
+
+        result = self._poll_run_status(client, run_id, 'timedout',
+            include=['executions', 'timeout', 'deadline'])
+        self.assertEquals(2, result['timeout'])
+        self.assertTrue(result['deadline'] > result['started'])
+        self.assertEquals(['timedout'], [e['status'] for e in result['executions']])
+
+    def test_workflow_deadline(self, client):
+        """Tests the deadline of a run defaults to the timeout of its workflow"""
+        name = 'test workflow deadline'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'timeout': 2,
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'duration': 100},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id)
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+
+        result = self._poll_run_status(client, run_id, 'timedout', include=['executions'])
+        self.assertEquals(['timedout'], [e['status'] for e in result['executions']])
+
+
+class TestExecutionWatchdog(BaseTestCase):
+    """Tests the reconciliation of stale executions"""
+    def test_stale_executions_started_together(self, client):
+        """Tests paging through stale executions does not skip those started together"""
+        name = 'test stale executions'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 30},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        ids = []
+        for i in range(2):
+            run = self._setup_active_run(client, workflow_id, ('step-0',))
+            self._runs.append(run['id'])
+            ids.append(run['executions'][0]['id'])
+
+        session = self.config.schema.session
+        started = current_timestamp() - timedelta(days=3650)
+        (session.query(WorkflowExecution).filter(WorkflowExecution.id.in_(ids))
+            .update({'started': started, 'dispatched': started, 'deadline': None},
+                synchronize_session=False))
+        session.commit()
+
+        first = WorkflowExecution.query_stale(session, 0, 1, limit=1)[0]
+        second = WorkflowExecution.query_stale(session, 0, 1, (first.started, first.id),
+            limit=1)[0]
+        self.assertEquals(sorted(ids), [first.id, second.id])
+        session.rollback()
+
+    def test_lease_election(self, client):
+        """Tests a lease is held by a single holder until it expires"""
+        session = self.config.schema.session
+        self.assertTrue(Lease.acquire(session, 'test-lease', 'node-a', 60))
+        self.assertFalse(Lease.acquire(session, 'test-lease', 'node-b', 60))
+        self.assertTrue(Lease.acquire(session, 'test-lease', 'node-a', 60))
+
+        lease = session.query(Lease).get('test-lease')
+        lease.expires = current_timestamp() - timedelta(seconds=1)
+        session.commit()
+
+        self.assertTrue(Lease.acquire(session, 'test-lease', 'node-b', 60))
+        self.assertFalse(Lease.acquire(session, 'test-lease', 'node-a', 60))
+
+        session.query(Lease).filter_by(id='test-lease').delete()
+        session.commit()
+
+
+class TestProcessDispatch(BaseTestCase):
+    """Tests the creation of processes for executions"""
+    def test_failed_process_creation(self, client):
+        """Tests an execution whose process cannot be created is processed as failed"""
+        name = 'test failed process creation'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 30},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        run = self._setup_active_run(client, workflow_id, ('step-0',))
+        self._runs.append(run['id'])
+        execution_id = run['executions'][0]['id']
+
+        ProcessDispatcher()._create_process('flux-operation:unknown-operation',
+            'step-0', None, execution_id, None, None)
+
+        result = self._poll_run_status(client, run['id'], 'failed', include=['executions'])
+        self.assertEquals('failed', result['executions'][0]['status'])
+
+    def test_priority_ordering(self, client):
+        """Tests pending processes of a higher priority are created first"""
+        dispatcher = ProcessDispatcher()
+        dispatcher.queue = PriorityQueue()
+
+        dispatcher.enqueue('test-queue', 'first')
+        dispatcher.enqueue('test-queue', 'urgent', priority=50)
+        dispatcher.enqueue('test-queue', 'second', priority=0)
+        dispatcher.enqueue('test-queue', 'urgent again', priority=50)
+        dispatcher.enqueue('test-queue', 'high', priority=10)
+
+        tags = []
+        while not dispatcher.queue.empty():
+            priority, sequence, params = dispatcher.queue.get_nowait()
+            tags.append(params[1])
+        self.assertEquals(['urgent', 'urgent again', 'high', 'first', 'second'], tags)
+
+
+class TestRunPriority(BaseTestCase):
+    """Tests workflow runs with priorities"""
+    def test_process_priority(self, client):
+        """Tests the processes of a run are created with its priority"""
+        name = 'test process priority'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 10},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        run = self._setup_active_run(client, workflow_id, ('step-0',), priority=50)
+        self._runs.append(run['id'])
+
+        process = Process.get(run['executions'][0]['id'])
+        self.assertEquals(50, process.priority)
+
+    def test_initiation_priority(self, client):
+        """Tests queued runs of a higher priority are initiated first"""
+        name = 'test initiation priority'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'max_active_runs': 1,
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 8},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        first = self._setup_active_run(client, workflow_id, ('step-0',))
+        self._runs.append(first['id'])
+
+        run_ids = []
+        for priority in (0, 50):
+            resp = client.execute('run', 'create', None, data={'workflow_id': workflow_id,
+                'name': '%s %d' % (name, priority), 'priority': priority})
+            self.assertEquals('OK', resp.status)
+            run_ids.append(resp.content['id'])
+            self._runs.append(resp.content['id'])
+
+        self._poll_run_status(client, first['id'], 'completed')
+        urgent = self._poll_run_status(client, run_ids[1], 'completed')
+        default = self._poll_run_status(client, run_ids[0], 'completed')
+        self.assertTrue(urgent['started'] < default['started'])
+
+
+class TestBatchProcessing(BaseTestCase):
+    """Tests processing batches of process status updates"""
+    def test_process_batch(self, client):
+        """Tests a batch reports the result of each of its updates"""
+        name = 'test process batch'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id)
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+
+        result = self._poll_run_status(client, run_id, 'completed', include=['executions'])
+        execution_id = result['executions'][0]['id']
+        unknown_id = '00000000-0000-0000-0000-000000000000'
+
+        resp = client.execute('operation', 'process_batch', data={'processes': [
+            {'id': execution_id, 'status': 'failed'},
+            {'id': unknown_id, 'status': 'completed'},
+        ]})
+        self.assertEquals('OK', resp.status)
+        self.assertEquals([
+            {'id': execution_id, 'result': 'ignored'},
+            {'id': unknown_id, 'result': 'unknown'},
+        ], resp.content['results'])
+
+        result = self._poll_run_status(client, run_id, 'completed')
+        self.assertEquals('completed', result['status'])
+
+    def test_duplicate_delivery(self, client):
+        """Tests a redelivered completion does not initiate steps again"""
+        name = 'test duplicate delivery'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                    'postoperation': [{
+                        'actions': [{
+                            'action': 'execute-step',
+                            'step': 'step-1',
+                        }],
+                    }],
+                },
+                'step-1': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id)
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+
+        result = self._poll_run_status(client, run_id, 'completed', include=['executions'])
+        execution_id = result['executions'][0]['id']
+
+        resp = client.execute('operation', 'process_batch', data={'processes': [
+            {'id': execution_id, 'status': 'completed',
+             'output': {'status': 'valid', 'outcome': 'completed'}},
+        ]})
+        self.assertEquals('OK', resp.status)
+        self.assertEquals('ignored', resp.content['results'][0]['result'])
+
+        result = self._poll_run_status(client, run_id, 'completed', include=['executions'])
+        self.assertEquals(['step-0', 'step-1'], [e['step'] for e in result['executions']])
+
+    def test_repeated_delivery(self, client):
+        """Tests the same delivery of an outcome is only processed once"""
+        name = 'test repeated delivery'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 30},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        run = self._setup_active_run(client, workflow_id, ('step-0',))
+        self._runs.append(run['id'])
+        execution_id = run['executions'][0]['id']
+
+        update = {'id': execution_id, 'status': 'completed', 'delivery': 'delivery-1',
+            'output': {'status': 'valid', 'outcome': 'completed', 'values': {}}}
+        resp = client.execute('operation', 'process_batch',
+            data={'processes': [update, update]})
+        self.assertEquals('OK', resp.status)
+        self.assertEquals(['processed', 'ignored'],
+            [r['result'] for r in resp.content['results']])
+
+        resp = client.execute('operation', 'process_batch', data={'processes': [update]})
+        self.assertEquals('OK', resp.status)
+        self.assertEquals('ignored', resp.content['results'][0]['result'])
+
+        result = self._poll_run_status(client, run['id'], 'completed',
+            include=['executions'])
+        self.assertEquals(['step-0'], [e['step'] for e in result['executions']])
+
+
+class TestEphemeralRuns(BaseTestCase):
+    """Tests ephemeral workflow runs"""
+    def test_ephemeral_run(self, client):
+        """Tests the executions of a completed ephemeral run are dropped"""
+        name = 'test ephemeral run'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+            },
+        })
+        resp = client.execute('workflow', 'create', None,
+            data={'name': name, 'specification': specification, 'is_service': True})
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+        self._workflows.append(workflow_id)
+
+        resp = client.execute('run', 'create', None,
+            data={'workflow_id': workflow_id, 'ephemeral': True})
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+        self._runs.append(run_id)
+
+        self._poll_run_status(client, run_id, 'completed')
+        for attempt in range(5):
+            resp = client.execute('run', 'get', run_id,
+                data={'include': ['executions', 'ephemeral']})
+            self.assertEquals('OK', resp.status)
+            if not resp.content['executions']:
+                break
+            sleep(2)
+
+        self.assertTrue(resp.content['ephemeral'])
+        self.assertEquals([], resp.content['executions'])
+
+    def test_ephemeral_run_requires_service(self, client):
+        """Tests only runs of services can be ephemeral"""
+        name = 'test ephemeral run of non-service'
+        resp = self._setup_workflow(client, name)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        with self.assertRaises(InvalidError):
+            client.execute('run', 'create', None,
+                data={'workflow_id': workflow_id, 'ephemeral': True})
+
+
+class TestInlineRuns(BaseTestCase):
+    """Tests workflow runs executed inline"""
+    def test_inline_run(self, client):
+        """Tests an inline run of a service returns once it has completed"""
+        name = 'test inline run'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+            },
+        })
+        resp = client.execute('workflow', 'create', None,
+            data={'name': name, 'specification': specification, 'is_service': True})
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+        self._workflows.append(workflow_id)
+
+        resp = client.execute('run', 'create', None,
+            data={'workflow_id': workflow_id, 'execute': 'inline', 'wait': 30})
+        self.assertEquals('OK', resp.status)
+        run_id = resp.content['id']
+        self._runs.append(run_id)
+
+        resp = client.execute('run', 'get', run_id)
+        self.assertEquals('OK', resp.status)
+        self.assertEquals('completed', resp.content['status'])
+
+    def test_inline_run_requires_service(self, client):
+        """Tests only runs of services can be executed inline"""
+        name = 'test inline run of non-service'
+        resp = self._setup_workflow(client, name)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        with self.assertRaises(InvalidError):
+            client.execute('run', 'create', None,
+                data={'workflow_id': workflow_id, 'execute': 'inline'})
+
+    def test_inline_wait_is_bounded(self, client):
+        """Tests an inline run cannot hold a request open for longer than a minute"""
+        name = 'test inline run wait'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 1},
+                },
+            },
+        })
+        resp = client.execute('workflow', 'create', None,
+            data={'name': name, 'specification': specification, 'is_service': True})
+        self.assertEquals('OK', resp.status)
+        self._workflows.append(resp.content['id'])
+
+        with self.assertRaises(InvalidError):
+            client.execute('run', 'create', None, data={'workflow_id': resp.content['id'],
+                'execute': 'inline', 'wait': 300})
+
+
+class TestAdmissionControl(BaseTestCase):
+    """Tests workflow runs admitted under a limit of active runs"""
+    def test_max_active_runs(self, client):
+        """Tests a run above the limit is queued until an active run ends"""
+        name = 'test max active runs'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'max_active_runs': 1,
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 3},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id, name='test max active runs 1')
+        self.assertEquals('OK', resp.status)
+        first_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id, name='test max active runs 2')
+        self.assertEquals('OK', resp.status)
+        second_id = resp.content['id']
+
+        first = self._poll_run_status(client, first_id, 'completed')
+        second = self._poll_run_status(client, second_id, 'completed')
+        self.assertTrue(second['started'] >= first['ended'])
+
+    def test_resume_under_limit(self, client):
+        """Tests a resumed run is queued while the limit of active runs is reached"""
+        name = 'test resume under limit'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'max_active_runs': 1,
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'failed', 'duration': 5},
+                },
+            },
+        })
+        resp = self._setup_workflow(client, name, specification)
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+
+        resp = self._setup_run(client, workflow_id, name='test resume under limit 1')
+        self.assertEquals('OK', resp.status)
+        first_id = resp.content['id']
+        self._poll_run_status(client, first_id, 'failed')
+
+        resp = self._setup_run(client, workflow_id, name='test resume under limit 2')
+        self.assertEquals('OK', resp.status)
+        second_id = resp.content['id']
+        self._poll_run_status(client, second_id, 'active')
+
+        resp = client.execute('run', 'update', first_id, {'status': 'pending'})
+        self.assertEquals('OK', resp.status)
+        sleep(1)
+
+        resp = client.execute('run', 'get', first_id, data={'include': ['queued']})
+        self.assertEquals('OK', resp.status)
+        self.assertEquals('pending', resp.content['status'])
+        self.assertIsNotNone(resp.content['queued'])
+
+        second = self._poll_run_status(client, second_id, 'failed')
+        first = self._poll_run_status(client, first_id, 'failed', include=['executions'])
+        self.assertEquals(2, len(first['executions']))
+        self.assertTrue(first['executions'][1]['started'] >= second['ended'])
+
+    def test_queued_inline_run(self, client):
+        """Tests an inline run queued above the limit returns without waiting"""
+        name = 'test queued inline run'
+        specification = Yaml.serialize({
+            'name': name,
+            'entry': 'step-0',
+            'max_active_runs': 1,
+            'steps': {
+                'step-0': {
+                    'operation': 'flux:test-operation',
+                    'parameters': {'outcome': 'completed', 'duration': 5},
+                },
+            },
+        })
+        resp = client.execute('workflow', 'create', None,
+            data={'name': name, 'specification': specification, 'is_service': True})
+        self.assertEquals('OK', resp.status)
+        workflow_id = resp.content['id']
+        self._workflows.append(workflow_id)
+
+        resp = self._setup_run(client, workflow_id, name='test queued inline run 1')
+        self.assertEquals('OK', resp.status)
+        first_id = resp.content['id']
+        self._poll_run_status(client, first_id, 'active', wait=1)
+
+        started = current_timestamp()
+        resp = client.execute('run', 'create', None, data={'workflow_id': workflow_id,
+            'name': 'test queued inline run 2', 'execute': 'inline', 'wait': 30})
+        self.assertEquals('OK', resp.status)
+        self._runs.append(resp.content['id'])
+        self.assertTrue((current_timestamp() - started).total_seconds() < 5)
+
+        resp = client.execute('run', 'get', resp.content['id'],
+            data={'include': ['queued']})
+        self.assertEquals('OK', resp.status)
+        self.assertEquals('pending', resp.content['status'])
+        self.assertIsNotNone(resp.content['queued'])
+        self._poll_run_status(client, resp.content['id'], 'completed')
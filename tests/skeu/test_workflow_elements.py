@@ -1,6 +1,7 @@
 from unittest import TestCase
 
-from scheme.fields import Integer, Structure, Text
+from scheme.fields import Field, Integer, Map, Structure, Surrogate, Text, Token
+from scheme.surrogate import surrogate
 from mesh.exceptions import OperationError
 from mesh.testing import MeshTestCase
 from spire.core import adhoc_configure, Unit
@@ -9,8 +10,10 @@ from spire.schema import SchemaDependency
 
 from flux.bundles import API
 from flux.engine.workflow import Layout, Workflow as WorkflowElement, reverse_enumerate
-from flux.engine.rule import RuleList
-from flux.models import Run, Workflow
+from flux.engine.interpolation import Interpolator, Template
+from flux.engine.plan import StepPlan
+from flux.engine.rule import Condition, RuleList
+from flux.models import Operation, Run, Workflow
 
 
 adhoc_configure({
@@ -157,6 +160,47 @@ class TestSpecification(BaseTestCase):
         with self.assertRaises(OperationError):
             rulelist.verify(steps)
 
+    def test_workflow_verify_foreach_fail(self, client):
+        """Tests rule lists with invalid foreach actions"""
+        steps = {
+            'step-1': None,
+            'step-2': None,
+        }
+        specifications = [
+            ['- actions:',
+             '  - action: execute-foreach',
+             '    step: step-3',
+             '    sequence: ${run.env.items}'],
+            ['- actions:',
+             '  - action: execute-foreach',
+             '    step: step-1',
+             '    sequence: ${run.env.items}',
+             '    join: step-3'],
+        ]
+        for specification in specifications:
+            rulelist = RuleList.unserialize('\n'.join(specification))
+            with self.assertRaises(OperationError):
+                rulelist.verify(steps)
+
+    def test_workflow_verify_wait_for_fail(self, client):
+        """Tests rule lists with invalid wait-for actions"""
+        steps = {
+            'step-1': None,
+        }
+        specifications = [
+            ['- actions:',
+             '  - action: wait-for',
+             '    step: step-3',
+             '    delay: 10'],
+            ['- actions:',
+             '  - action: wait-for',
+             '    step: step-1'],
+        ]
+        for specification in specifications:
+            rulelist = RuleList.unserialize('\n'.join(specification))
+            with self.assertRaises(OperationError):
+                rulelist.verify(steps)
+
     def test_workflow_verify_specification_pass(self, client):
         """Tests valid specification workflow yaml"""
         name = 'valid specification workflow'
@@ -218,6 +262,76 @@ class TestSpecification(BaseTestCase):
         with self.assertRaises(OperationError):
             Workflow._verify_specification(specification)
 
+    def test_workflow_verify_parallel_pass(self, client):
+        """Tests valid parallel step specification"""
+        specification = '\n'.join([
+            'name: valid parallel workflow',
+            'entry: step-0',
+            'steps:',
+            '  step-0:',
+            '    parallel:',
+            '      branches: [step-1, step-2]',
+            '      join: step-3',
+            '      quorum: 1',
+            '  step-1:',
+            '    operation: flux:test-operation',
+            '  step-2:',
+            '    operation: flux:test-operation',
+            '  step-3:',
+            '    operation: flux:test-operation',
+        ])
+        Workflow._verify_specification(specification)
+
+    def test_workflow_verify_parallel_fail(self, client):
+        """Tests invalid parallel step specifications"""
+        invalid_parallels = [
+            ['    operation: flux:test-operation',
+             '    parallel:',
+             '      branches: [step-1]'],
+            ['    parallel:',
+             '      branches: [step-1, step-4]'],
+            ['    parallel:',
+             '      branches: [step-1]',
+             '      join: step-1'],
+            ['    parallel:',
+             '      branches: [step-1]',
+             '      quorum: 2'],
+            ['    parallel:',
+             '      branches: [step-1]',
+             '    cache:',
+             '      ttl: 60'],
+            ['    parallel:',
+             '      branches: [step-1]',
+             '    retry:',
+             '      attempts: 2'],
+            ['    parallel:',
+             '      branches: [step-2]',
+             '  step-2:',
+             '    parallel:',
+             '      branches: [step-1]'],
+            ['    operation: flux:test-operation',
+             '    postoperation:',
+             '    - actions:',
+             '      - action: execute-foreach',
+             '        step: step-2',
+             '        sequence: ${run.env.items}',
+             '  step-2:',
+             '    parallel:',
+             '      branches: [step-1]'],
+        ]
+        for parallel in invalid_parallels:
+            specification = '\n'.join([
+                'name: invalid parallel workflow',
+                'entry: step-0',
+                'steps:',
+                '  step-0:',
+            ] + parallel + [
+                '  step-1:',
+                '    operation: flux:test-operation',
+            ])
+            with self.assertRaises(OperationError):
+                Workflow._verify_specification(specification)
+
 
 class TestUtilities(TestCase):
     """Test utility functions"""
@@ -241,3 +355,111 @@ class TestUtilities(TestCase):
         ]
         result = [l for l in reverse_enumerate(test_list, 9)]
         self.assertEquals(expected, result)
+
+
+class TestCompilation(TestCase):
+    """Test compilation of workflow conditions and action templates"""
+
+    def test_compiled_condition(self):
+        """Test evaluation of a compiled rule condition"""
+        condition = Condition.unserialize('step.out.count > 2')
+        condition.compile()
+
+        interpolator = Interpolator({'step': {'out': {'count': 3}}})
+        self.assertTrue(interpolator.evaluate(condition.expression))
+        interpolator = Interpolator({'step': {'out': {'count': 1}}})
+        self.assertFalse(interpolator.evaluate(condition.expression))
+
+    def test_compiled_template(self):
+        """Test compiled templates interpolate like their fields"""
+        field = Map(Field(nonempty=True), Token(nonempty=True))
+        subject = {
+            'structure': '${run.env.structure}',
+            'value': '${step.out.value}',
+            'undefined': '${step.out.undefined}',
+            'literal': 'literal ${value}',
+        }
+        interpolator = Interpolator({
+            'run': {'env': {'structure': {'value': 1}}},
+            'step': {'out': {'value': 'test'}},
+        })
+
+        expected = {
+            'structure': {'value': 1},
+            'value': 'test',
+            'literal': 'literal ${value}',
+        }
+        template = Template(field, subject)
+        self.assertEquals(expected, interpolator.interpolate(field, template))
+        self.assertEquals(expected, interpolator.interpolate(field, subject))
+
+    def test_compiled_typed_template(self):
+        """Test compiled templates interpolate typed values through their fields"""
+        field = Structure({
+            'path': Text(),
+            'count': Integer(),
+            'products': Map(Surrogate()),
+        })
+        subject = {
+            'path': '/data/${run.env.dir}/x',
+            'count': '3',
+            'products': {'product': '${step.out.product}'},
+        }
+        product = surrogate.construct(value={'id': 'product'},
+            schema=Structure({'id': Token()}))
+        interpolator = Interpolator({
+            'run': {'env': {'dir': 'abc'}},
+            'step': {'out': {'product': product.serialize()}},
+        })
+
+        expected = interpolator.interpolate(field, subject)
+        self.assertEquals('/data/abc/x', expected['path'])
+        self.assertEquals(3, expected['count'])
+        self.assertIsInstance(expected['products']['product'], surrogate)
+
+        result = interpolator.interpolate(field, Template(field, subject))
+        self.assertEquals(expected, result)
+        self.assertIs(type(expected['products']['product']),
+            type(result['products']['product']))
+
+    def test_step_plan_parameters(self):
+        """Test step plans interpolate their static parameters like their schema"""
+        schema = Structure({'path': Text(), 'count': Integer()})
+        operation = Operation(id='test:operation', schema=schema,
+            parameters={'count': '3'})
+        workflow = WorkflowElement.unserialize({
+            'name': 'test step plan',
+            'entry': 'step-0',
+            'steps': {
+                'step-0': {
+                    'operation': 'test:operation',
+                    'parameters': {'path': '/data/${run.env.dir}/x'},
+                },
+            },
+        })
+
+        plan = StepPlan(workflow.steps['step-0'], operation)
+        interpolator = Interpolator({'run': {'env': {'dir': 'abc'}}})
+        self.assertEquals({'path': '/data/abc/x', 'count': 3},
+            interpolator.interpolate(schema, plan.prepare_parameters()))
+        self.assertEquals({'path': '/other', 'count': 3},
+            interpolator.interpolate(schema, plan.prepare_parameters({'path': '/other'})))
+
+    def test_layered_interpolator(self):
+        """Test layered interpolation writes only to the top layer"""
+        run = {'run': {'env': {'structure': {'value': 1}}}}
+        step = {'step': {'serial': 1}}
+
+        interpolator = Interpolator()
+        interpolator.merge(run)
+        interpolator.merge(step)
+        interpolator['step']['out'] = {'value': 'test'}
+
+        self.assertEquals({'serial': 1, 'out': {'value': 'test'}}, dict(interpolator['step']))
+        self.assertEquals({'step': {'serial': 1}}, step)
+        self.assertEquals(1, interpolator.evaluate('run.env.structure.value'))
+
+        field = Map(Field(nonempty=True), Token(nonempty=True))
+        result = interpolator.interpolate(field, {'step': '${step}'})
+        self.assertEquals({'step': {'serial': 1, 'out': {'value': 'test'}}}, result)
+        self.assertIs(dict, type(result['step']))